@@ -0,0 +1,54 @@
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("ICP_CACHE_FILE", os.path.join(tempfile.gettempdir(), "icp_bench_cache.sqlite3"))
+os.environ.setdefault("ICP_JOB_DB_FILE", os.path.join(tempfile.gettempdir(), "icp_bench_jobs.sqlite3"))
+
+import miit_icp_web  # noqa: E402
+
+
+class FakeDetailClient:
+    # 只模拟详情接口的网络延迟，用于对比串行与并发补全的耗时。
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.calls = 0
+
+    async def query_detail_by_app_and_mini_id(self, data_id: Any, service_type: int | None = None) -> dict[str, Any]:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return {"code": 200, "params": {"dataId": data_id, "serviceName": f"app-{data_id}"}}
+
+
+async def _run(records: list[dict[str, Any]], latency: float, concurrency: int) -> float:
+    client = FakeDetailClient(latency)
+    start = time.perf_counter()
+    enriched = await miit_icp_web._enrich_app_records(client, records, 7, concurrency=concurrency)
+    elapsed = time.perf_counter() - start
+    assert [r["dataId"] for r in enriched] == [r["dataId"] for r in records]
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="详情补全串行/并发耗时对比")
+    parser.add_argument("--records", type=int, default=200, help="记录条数")
+    parser.add_argument("--latency", type=float, default=0.05, help="单次详情请求模拟延迟(秒)")
+    parser.add_argument("--concurrency", type=int, default=miit_icp_web.ENRICH_CONCURRENCY, help="并发上限")
+    args = parser.parse_args()
+
+    records = [{"dataId": i, "unitName": f"unit-{i}"} for i in range(1, args.records + 1)]
+    serial = asyncio.run(_run(records, args.latency, 1))
+    parallel = asyncio.run(_run(records, args.latency, max(1, args.concurrency)))
+    print(f"records={args.records} latency={args.latency * 1000:.0f}ms")
+    print(f"serial:          {serial:8.3f} s")
+    print(f"concurrency={args.concurrency:<3} {parallel:8.3f} s  ({serial / parallel:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
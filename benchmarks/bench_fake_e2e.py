@@ -0,0 +1,89 @@
+import argparse
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import miit_icp_auto_query  # noqa: E402
+from miit_icp_fake_server import FakeMiitConfig, FakeMiitServer  # noqa: E402
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def _run_one(base_url: str, transport: str, keyword: str, args: argparse.Namespace) -> tuple[float, bool]:
+    # 与命令行单条查询相同的流程：鉴权 -> 过滑块(失败重试) -> 全量翻页。
+    started = time.perf_counter()
+    try:
+        client = miit_icp_auto_query.MiitIcpAutoClient(transport=transport, base_url=base_url)
+        client.detail_cache = None
+        client.auth()
+        for attempt in range(args.retries):
+            try:
+                client.verify_slider(client.get_check_images())
+                break
+            except Exception:
+                if attempt == args.retries - 1:
+                    raise
+        client.query_company_all(keyword, service_type=args.service_type, page_size=args.page_size)
+        ok = True
+    except Exception:
+        ok = False
+    return time.perf_counter() - started, ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="基于本地模拟服务的端到端吞吐与尾延迟")
+    parser.add_argument("--queries", type=int, default=50, help="查询条数")
+    parser.add_argument("--concurrency", type=int, default=4, help="并发线程数")
+    parser.add_argument("--transport", choices=["curl", "requests"], default="requests", help="请求通道")
+    parser.add_argument("--latency", type=float, default=0.02, help="模拟服务单请求延迟(秒)")
+    parser.add_argument("--jitter", type=float, default=0.01, help="模拟服务随机延迟上限(秒)")
+    parser.add_argument("--records", type=int, default=45, help="每个关键词的记录数")
+    parser.add_argument("--page-size", type=int, default=10, help="每页条数")
+    parser.add_argument("--service-type", type=int, default=1, help="服务类型")
+    parser.add_argument("--waf-rate", type=float, default=0.0, help="403 注入比例")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="业务失败注入比例")
+    parser.add_argument("--retries", type=int, default=3, help="滑块重试次数")
+    args = parser.parse_args()
+
+    config = FakeMiitConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        records=args.records,
+        waf_rate=args.waf_rate,
+        error_rate=args.error_rate,
+    )
+    keywords = [f"压测科技有限公司{i}" for i in range(args.queries)]
+    with FakeMiitServer(config) as server:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as pool:
+            results: list[Any] = list(
+                pool.map(lambda kw: _run_one(server.base_url, args.transport, kw, args), keywords)
+            )
+        elapsed = time.perf_counter() - started
+        stats = dict(server.state.stats)
+
+    latencies = [t for t, _ in results]
+    ok = sum(1 for _, success in results if success)
+    print(f"queries={args.queries} concurrency={args.concurrency} records={args.records} page_size={args.page_size}")
+    print(f"ok={ok} failed={len(results) - ok} wall={elapsed:.2f}s throughput={len(results) / elapsed:.2f} q/s")
+    print(
+        f"latency ms: mean={statistics.mean(latencies) * 1000:.1f} p50={_percentile(latencies, 50) * 1000:.1f}"
+        f" p95={_percentile(latencies, 95) * 1000:.1f} p99={_percentile(latencies, 99) * 1000:.1f}"
+        f" max={max(latencies) * 1000:.1f}"
+    )
+    print("server:", ", ".join(f"{k}={v}" for k, v in sorted(stats.items())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("ICP_CACHE_FILE", os.path.join(tempfile.gettempdir(), "icp_bench_cache.sqlite3"))
+os.environ.setdefault("ICP_JOB_DB_FILE", os.path.join(tempfile.gettempdir(), "icp_bench_jobs.sqlite3"))
+os.environ.setdefault("ICP_INDEX_FILE", "")
+
+import miit_icp_auto_query  # noqa: E402
+import miit_icp_web  # noqa: E402
+from miit_icp_export import export_row_from_cli, iter_csv_chunks, iter_jsonl_chunks, record_columns  # noqa: E402
+from miit_icp_fake_server import synthetic_detail, synthetic_record  # noqa: E402
+
+
+class PagedClient(miit_icp_auto_query.MiitIcpAutoClient):
+    # 跳过网络，只测 query_company_all 的翻页决策、逐页合并与 _merge_pages。
+    def __init__(self, pages: list[dict[str, Any]]) -> None:
+        miit_icp_auto_query.MiitIcpClientBase.__init__(self, "bench")
+        self.pages = pages
+
+    def query_company(
+        self,
+        company: str,
+        service_type: int = 1,
+        page_num: int | str | None = None,
+        page_size: int | str | None = None,
+    ) -> dict[str, Any]:
+        return self.pages[int(page_num or 1) - 1]
+
+
+def _make_pages(records: list[dict[str, Any]], page_size: int, reliable_pages: bool) -> list[dict[str, Any]]:
+    # reliable_pages=False 时 pages 固定为 1，迫使翻页走按 total 探测的 fallback 分支。
+    total = len(records)
+    count = max(1, (total + page_size - 1) // page_size)
+    pages = []
+    for i in range(count):
+        chunk = records[i * page_size : (i + 1) * page_size]
+        params = {"list": chunk, "total": total, "pageNum": i + 1, "pageSize": page_size}
+        params["pages"] = count if reliable_pages else 1
+        pages.append({"code": 200, "success": True, "params": params})
+    pages.append({"code": 200, "success": True, "params": {"list": [], "total": total, "pageNum": count + 1}})
+    return pages
+
+
+def _measure(fn: Callable[[], Any], repeat: int) -> dict[str, float]:
+    # 计时与内存分开跑：tracemalloc 本身会拖慢执行，峰值内存单独测一次。
+    fn()
+    timings = []
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"best_ms": min(timings) * 1000, "median_ms": statistics.median(timings) * 1000, "peak_mb": peak / 2**20}
+
+
+def build_cases(args: argparse.Namespace) -> dict[str, Callable[[], Any]]:
+    n = args.records
+    web_records = [synthetic_record("基准测试科技有限公司", 1, i) for i in range(n)]
+    app_records = [synthetic_record("基准测试科技有限公司", 6, i) for i in range(n)]
+    details = [{"code": 200, "success": True, "params": synthetic_detail(r["dataId"], 6)} for r in app_records]
+    reliable = _make_pages(web_records, args.page_size, reliable_pages=True)
+    unreliable = _make_pages(web_records, args.page_size, reliable_pages=False)
+    max_pages = len(reliable) + 1
+
+    # 批量结果：args.queries 行，每行 n / queries 条记录，结构与 web 批量查询一致。
+    per_row = max(1, n // args.queries)
+    batch_rows = [
+        export_row_from_cli(
+            {
+                "query": f"主体{q}",
+                "ok": True,
+                "result": {"params": {"list": web_records[q * per_row : (q + 1) * per_row]}},
+            }
+        )
+        for q in range(args.queries)
+    ]
+
+    def drain(chunks: Any) -> int:
+        return sum(len(c) for c in chunks)
+
+    return {
+        "query_company_all": lambda: PagedClient(reliable).query_company_all(
+            "基准", page_size=args.page_size, max_pages=max_pages
+        ),
+        "query_company_all_fallback": lambda: PagedClient(unreliable).query_company_all(
+            "基准", page_size=args.page_size, max_pages=max_pages
+        ),
+        "merge_detail_into_record": lambda: [
+            miit_icp_web._merge_detail_into_record(r, d) for r, d in zip(app_records, details)
+        ],
+        "record_columns": lambda: record_columns(web_records),
+        "export_csv": lambda: drain(iter_csv_chunks(batch_rows)),
+        "export_jsonl": lambda: drain(iter_jsonl_chunks(batch_rows)),
+        "json_dumps_batch": lambda: len(json.dumps({"results": batch_rows}, ensure_ascii=False)),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="纯 Python 热点路径基准：耗时与 tracemalloc 峰值内存")
+    parser.add_argument("--records", type=int, default=100_000, help="合成记录条数")
+    parser.add_argument("--queries", type=int, default=100, help="导出/序列化用的批量结果行数")
+    parser.add_argument("--page-size", type=int, default=10, help="翻页基准的每页条数")
+    parser.add_argument("--repeat", type=int, default=5, help="每项计时次数")
+    parser.add_argument("--only", default="", help="只跑名称包含该子串的基准")
+    parser.add_argument("--save", default="", help="把结果写入 JSON 文件")
+    parser.add_argument("--compare", default="", help="与之前 --save 的结果对比")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    cases = build_cases(args)
+    print(f"records={args.records} queries={args.queries} setup={time.perf_counter() - started:.2f}s")
+    baseline = json.loads(Path(args.compare).read_text(encoding="utf-8")) if args.compare else {}
+
+    results: dict[str, dict[str, float]] = {}
+    print(f"{'case':<28} {'best ms':>10} {'median ms':>10} {'peak MB':>9}  vs baseline")
+    for name, fn in cases.items():
+        if args.only and args.only not in name:
+            continue
+        result = _measure(fn, args.repeat)
+        results[name] = result
+        delta = ""
+        if name in baseline and baseline[name].get("best_ms"):
+            old = baseline[name]
+            delta = (
+                f"time {result['best_ms'] / old['best_ms'] - 1:+.1%}"
+                f", peak {result['peak_mb'] - old.get('peak_mb', 0):+.1f} MB"
+            )
+        print(f"{name:<28} {result['best_ms']:>10.1f} {result['median_ms']:>10.1f} {result['peak_mb']:>9.1f}  {delta}")
+
+    if args.save:
+        Path(args.save).write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"saved: {args.save}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import miit_icp_auto_query  # noqa: E402
+from miit_icp_fake_server import FakeMiitConfig, FakeMiitServer  # noqa: E402
+
+
+def _verified_client(**kwargs: str) -> miit_icp_auto_query.MiitIcpAutoClient:
+    client = miit_icp_auto_query.MiitIcpAutoClient(**kwargs)
+    client.detail_cache = None
+    client.auth()
+    client.verify_slider(client.get_check_images())
+    return client
+
+
+def _record(args: argparse.Namespace) -> None:
+    # 夹具不存在时，对本地模拟服务录制一次；也可以先用 `--fixture` 对线上接口录制真实数据。
+    config = FakeMiitConfig(latency=0, records=args.pages * args.page_size, captcha_tolerance=-1)
+    with FakeMiitServer(config) as server:
+        client = _verified_client(transport="requests", base_url=server.base_url, fixture=args.fixture)
+        client.query_company_all(
+            args.keyword, service_type=args.service_type, page_size=args.page_size, max_pages=args.pages
+        )
+        client.close()
+    size = Path(args.fixture).stat().st_size
+    print(f"recorded {args.pages} pages -> {args.fixture} ({size / 1024 / 1024:.2f} MB)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="用录制的夹具回放 query_company_all，检测翻页/合并的性能回退")
+    parser.add_argument("--fixture", default="bench_replay_fixture.jsonl.gz", help="夹具文件，不存在时先录制")
+    parser.add_argument("--keyword", default="回放压测科技有限公司", help="查询关键词(需与夹具一致)")
+    parser.add_argument("--service-type", type=int, default=1, help="服务类型")
+    parser.add_argument("--pages", type=int, default=2000, help="录制时的页数")
+    parser.add_argument("--page-size", type=int, default=10, help="每页条数")
+    parser.add_argument("--repeat", type=int, default=5, help="回放次数")
+    args = parser.parse_args()
+
+    if not Path(args.fixture).exists():
+        _record(args)
+
+    load_started = time.perf_counter()
+    client = _verified_client(transport="replay", fixture=args.fixture)
+    print(f"load+verify: {time.perf_counter() - load_started:.3f} s")
+
+    timings = []
+    records = 0
+    for _ in range(max(1, args.repeat)):
+        started = time.perf_counter()
+        merged = client.query_company_all(
+            args.keyword, service_type=args.service_type, page_size=args.page_size, max_pages=args.pages
+        )
+        timings.append(time.perf_counter() - started)
+        records = len((merged.get("params") or {}).get("list") or [])
+
+    best = min(timings)
+    print(f"pages={args.pages} records={records} repeat={len(timings)}")
+    print(f"query_company_all: best={best * 1000:.1f} ms median={statistics.median(timings) * 1000:.1f} ms")
+    print(f"throughput: {args.pages / best:,.0f} pages/s, {records / best:,.0f} records/s")
+
+
+if __name__ == "__main__":
+    main()
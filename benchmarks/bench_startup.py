@@ -0,0 +1,108 @@
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parent.parent
+
+COMMANDS = {
+    "import miit_icp_auto_query": [sys.executable, "-c", "import miit_icp_auto_query"],
+    "icp.py --help": [sys.executable, "icp.py", "--help"],
+    "import miit_icp_web": [sys.executable, "-c", "import miit_icp_web"],
+}
+
+
+def _time_command(cmd: list[str], cwd: Path, repeat: int) -> list[float]:
+    samples: list[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(cmd, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return int(sock.getsockname()[1])
+
+
+def _time_uvicorn(cwd: Path, repeat: int, timeout: float = 60.0) -> list[float]:
+    # 从启动进程到端口可连接视为冷启动完成。
+    samples: list[float] = []
+    for _ in range(repeat):
+        port = _free_port()
+        start = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "miit_icp_web:app", "--host", "127.0.0.1", "--port", str(port)],
+            cwd=cwd,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            while True:
+                if proc.poll() is not None:
+                    raise RuntimeError("uvicorn exited before accepting connections")
+                if time.perf_counter() - start > timeout:
+                    raise RuntimeError("uvicorn startup timed out")
+                try:
+                    with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                        break
+                except OSError:
+                    time.sleep(0.02)
+            samples.append(time.perf_counter() - start)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=10)
+    return samples
+
+
+def measure(cwd: Path, repeat: int, with_uvicorn: bool) -> dict[str, list[float]]:
+    results = {name: _time_command(cmd, cwd, repeat) for name, cmd in COMMANDS.items()}
+    if with_uvicorn:
+        results["uvicorn miit_icp_web:app"] = _time_uvicorn(cwd, repeat)
+    return results
+
+
+def _fmt(samples: list[float]) -> str:
+    return f"median {statistics.median(samples) * 1000:8.1f} ms  min {min(samples) * 1000:8.1f} ms"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="CLI / web 冷启动耗时对比")
+    parser.add_argument("--repeat", type=int, default=5, help="每条命令重复次数")
+    parser.add_argument("--baseline", default="", help="对比用的 git 版本(如 HEAD~1)，为空则只测当前代码")
+    parser.add_argument("--no-uvicorn", action="store_true", help="跳过 uvicorn 启动测试")
+    args = parser.parse_args()
+
+    repeat = max(1, args.repeat)
+    current = measure(ROOT, repeat, not args.no_uvicorn)
+
+    baseline: dict[str, list[float]] = {}
+    if args.baseline:
+        with tempfile.TemporaryDirectory() as tmp:
+            worktree = Path(tmp) / "baseline"
+            subprocess.run(["git", "worktree", "add", "--detach", str(worktree), args.baseline], cwd=ROOT, check=True)
+            try:
+                baseline = measure(worktree, repeat, not args.no_uvicorn)
+            finally:
+                subprocess.run(["git", "worktree", "remove", "--force", str(worktree)], cwd=ROOT, check=False)
+
+    for name, samples in current.items():
+        line = f"{name:<28} after:  {_fmt(samples)}"
+        if name in baseline:
+            before = statistics.median(baseline[name])
+            after = statistics.median(samples)
+            line = f"{name:<28} before: {_fmt(baseline[name])}\n{'':<28} after:  {_fmt(samples)}  ({before / after:.1f}x)"
+        print(line)
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("ICP_CACHE_FILE", os.path.join(tempfile.gettempdir(), "icp_bench_cache.sqlite3"))
+    main()
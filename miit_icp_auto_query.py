@@ -1,72 +1,540 @@
 import argparse
+import asyncio
 import base64
+import functools
 import hashlib
+import importlib.util
+import inspect
 import json
 import os
+import sys
+import threading
 import time
 import uuid
+import weakref
+from contextlib import contextmanager
 from io import BytesIO
 from pathlib import Path
-from typing import Any
+from typing import Any, AsyncIterator, Callable, Iterator
 
-import cv2
-import ddddocr
-import numpy as np
 import requests
-from PIL import Image
 from curl_cffi import requests as curl_requests
 
+from miit_icp_cache import (
+    DEFAULT_CACHE_FILE,
+    DEFAULT_CACHE_MAX_ENTRIES,
+    DEFAULT_CACHE_TTL,
+    DEFAULT_DETAIL_CACHE_MAX_ENTRIES,
+    DetailCache,
+    ResultCache,
+)
+from miit_icp_export import BINARY_EXPORTS, export_row_from_cli, iter_csv_chunks, write_csv
+from miit_icp_index import DEFAULT_INDEX_FILE, DEFAULT_SEARCH_LIMIT, SEARCH_MODES, RecordIndex
+from miit_icp_metrics import QUERY_PAGES, RETRIES, STAGE_RESULTS, STAGE_SECONDS
+from miit_icp_profile import span, start_profiling, stop_profiling
+from miit_icp_replay import RecordingSession, ReplaySession
+
 
-BASE_URL = "https://hlwicpfwc.miit.gov.cn/icpproject_query/api/"
+DEFAULT_BASE_URL = "https://hlwicpfwc.miit.gov.cn/icpproject_query/api/"
+# 可通过 ICP_BASE_URL 指向本地模拟服务(miit_icp_fake_server.py)做离线压测。
+BASE_URL = os.environ.get("ICP_BASE_URL") or DEFAULT_BASE_URL
+# replay 从夹具文件回放录制好的请求/响应，不访问网络。
+TRANSPORTS = ("curl", "requests", "replay")
 UA = (
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
     "AppleWebKit/537.36 (KHTML, like Gecko) "
     "Chrome/123.0.0.0 Safari/537.36"
 )
 
+# 业务失败时，这些提示说明 token/uuid/sign 已失效，需要重新鉴权和过滑块。
+_CREDENTIAL_EXPIRED_HINTS = ("token", "sign", "uuid", "过期", "失效", "重新")
 
-class MiitIcpAutoClient:
-    def __init__(self, transport: str = "curl") -> None:
-        # 某些环境下会设置无协议代理(如 127.0.0.1:7897)，会让 requests/selenium 直接报错。
-        for key in ("http_proxy", "https_proxy", "HTTP_PROXY", "HTTPS_PROXY"):
-            val = os.environ.get(key, "")
-            if val and "://" not in val:
-                os.environ.pop(key, None)
-        os.environ.setdefault("NO_PROXY", "localhost,127.0.0.1")
 
-        self.transport = transport
-        if transport == "curl":
-            self.session = curl_requests.Session(impersonate="chrome124")
-        else:
-            self.session = requests.Session()
-        self.session.headers.update(
-            {
-                "User-Agent": UA,
-                "Accept": "application/json, text/plain, */*",
-                "Origin": "https://beian.miit.gov.cn",
-                "Referer": "https://beian.miit.gov.cn/",
-                "X-Requested-With": "XMLHttpRequest",
-            }
+class CredentialExpiredError(RuntimeError):
+    pass
+
+
+class PoolExhaustedError(RuntimeError):
+    pass
+
+
+# 出现这些错误后客户端的 token/会话已不可信，连接池不再复用。
+_UNHEALTHY_OUTCOMES = ("waf_403", "credential_expired")
+
+
+def _classify_error(stage: str, exc: BaseException) -> str:
+    text = str(exc).lower()
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status == 403 or "http 403" in text:
+        return "waf_403"
+    if isinstance(exc, CredentialExpiredError):
+        return "credential_expired"
+    if stage in ("check_images", "verify_slider"):
+        return "captcha"
+    if "failed" in text:
+        return "business"
+    if isinstance(exc, OSError) or "timeout" in type(exc).__name__.lower() or "connection" in text:
+        return "network"
+    return "error"
+
+
+@contextmanager
+def _observe_stage(stage: str, owner: Any = None, **span_args: Any) -> Iterator[None]:
+    # 记录一次阶段调用的耗时与结果分类，供 /metrics 输出；开启 --profile 时同时记录 span。
+    # owner 为发起调用的客户端，遇到风控/凭据失效时标记为不健康。
+    started = time.perf_counter()
+    outcome = "cancelled"
+    try:
+        with span(stage, **span_args):
+            yield
+        outcome = "ok"
+    except Exception as exc:
+        outcome = _classify_error(stage, exc)
+        if owner is not None and outcome in _UNHEALTHY_OUTCOMES:
+            owner.healthy = False
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage)
+        STAGE_RESULTS.inc(stage, outcome)
+
+
+def _instrumented(stage: str) -> Callable[[Any], Any]:
+    # 同步/异步客户端方法共用的计时装饰器。
+    def wrap(fn: Any) -> Any:
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def run_async(*args: Any, **kwargs: Any) -> Any:
+                with _observe_stage(stage, owner=args[0], page=kwargs.get("page_num")):
+                    return await fn(*args, **kwargs)
+
+            return run_async
+
+        @functools.wraps(fn)
+        def run(*args: Any, **kwargs: Any) -> Any:
+            with _observe_stage(stage, owner=args[0], page=kwargs.get("page_num")):
+                return fn(*args, **kwargs)
+
+        return run
+
+    return wrap
+
+
+# cv2/ddddocr/numpy/PIL 导入耗时较长，只在真正需要识别滑块时才加载。
+_SLIDE_OCR: Any = None
+_SLIDE_OCR_LOCK = threading.Lock()
+
+
+def get_slide_ocr() -> Any:
+    # 进程内共享一个滑块模型；slide_match 不修改实例状态，可被多线程同时调用。
+    global _SLIDE_OCR
+    if _SLIDE_OCR is None:
+        with _SLIDE_OCR_LOCK:
+            if _SLIDE_OCR is None:
+                import ddddocr
+
+                _SLIDE_OCR = ddddocr.DdddOcr(det=False, ocr=False, show_ad=False)
+    return _SLIDE_OCR
+
+
+def calc_slider_offset(big_img: bytes, small_img: bytes) -> int:
+    import cv2
+    import numpy as np
+    from PIL import Image
+
+    candidates: list[int] = []
+
+    # 1) ddddocr 候选
+    for simple_target in (False, True):
+        try:
+            result = get_slide_ocr().slide_match(
+                target_bytes=small_img,
+                background_bytes=big_img,
+                simple_target=simple_target,
+            )
+            target = result.get("target")
+            if isinstance(target, list) and len(target) >= 1:
+                x = int(target[0])
+                if 1 <= x <= 435:
+                    candidates.append(x)
+        except Exception:
+            pass
+
+    # 2) OpenCV 掩码模板匹配（一次命中率更高）
+    cv_x: int | None = None
+    try:
+        big_gray = cv2.imdecode(np.frombuffer(big_img, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        small_rgba = cv2.imdecode(np.frombuffer(small_img, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+        if big_gray is not None and small_rgba is not None and len(small_rgba.shape) == 3 and small_rgba.shape[2] == 4:
+            small_gray = cv2.cvtColor(small_rgba[:, :, :3], cv2.COLOR_BGR2GRAY)
+            alpha_mask = small_rgba[:, :, 3]
+            res = cv2.matchTemplate(big_gray, small_gray, cv2.TM_CCORR_NORMED, mask=alpha_mask)
+            _, _, _, max_loc = cv2.minMaxLoc(res)
+            cv_x = int(max_loc[0])
+            if 1 <= cv_x <= 435:
+                candidates.append(cv_x)
+    except Exception:
+        pass
+
+    # 3) 透明边裁剪后再次 ddddocr，作为补偿候选
+    try:
+        rgba = Image.open(BytesIO(small_img)).convert("RGBA")
+        alpha = np.array(rgba)[:, :, 3]
+        ys, xs = np.where(alpha > 8)
+        if len(xs) > 0 and len(ys) > 0:
+            left, top, right, bottom = xs.min(), ys.min(), xs.max(), ys.max()
+            cropped = rgba.crop((left, top, right + 1, bottom + 1))
+            buf = BytesIO()
+            cropped.save(buf, format="PNG")
+            result = get_slide_ocr().slide_match(
+                target_bytes=buf.getvalue(),
+                background_bytes=big_img,
+                simple_target=True,
+            )
+            target = result.get("target")
+            if isinstance(target, list) and len(target) >= 1:
+                x = int(target[0])
+                if 1 <= x <= 435:
+                    candidates.append(x)
+    except Exception:
+        pass
+
+    if not candidates:
+        raise RuntimeError("failed to compute slider offset by ddddocr/opencv")
+
+    # 去重后按与 cv_x 的接近程度排序；若无 cv_x，则优先较大的候选（经验上更稳定）
+    uniq = sorted(set(candidates))
+    if cv_x is not None:
+        uniq.sort(key=lambda v: abs(v - cv_x))
+        return uniq[0]
+    return sorted(uniq, reverse=True)[0]
+
+
+DEFAULT_OFFSET_QUEUE_PER_WORKER = 4
+
+
+def _preload_offset_worker() -> None:
+    # 子进程启动时预先导入 cv2/numpy/PIL 并加载滑块模型，首个任务不再承担加载耗时。
+    import importlib
+
+    for name in ("cv2", "numpy", "PIL.Image"):
+        importlib.import_module(name)
+    get_slide_ocr()
+
+
+class OffsetWorkerPool:
+    # 滑块识别是 CPU 密集计算，放到独立进程里并行，避免在请求线程里长时间占用 GIL。
+    # 在途任务数有上限(workers * queue_per_worker)，超出时提交方阻塞等待；进程池异常时退回本线程计算。
+    def __init__(self, workers: int, queue_per_worker: int = DEFAULT_OFFSET_QUEUE_PER_WORKER) -> None:
+        self.workers = max(1, workers)
+        self.max_pending = self.workers * max(1, queue_per_worker)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        # 异步调用方按事件循环各用一个 asyncio.Semaphore 限流，等待时挂起协程而不是轮询，按到达顺序放行。
+        self._loop_slots: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore] = (
+            weakref.WeakKeyDictionary()
         )
+        self._lock = threading.Lock()
+        self._executor: Any = None
+        self.in_flight = 0
+        self.completed = 0
+        self.fallbacks = 0
+
+    def _get_executor(self) -> Any:
+        # 首次使用时才启动子进程，不拖慢冷启动；spawn 避免在多线程进程里 fork。
+        with self._lock:
+            if self._executor is None:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_preload_offset_worker,
+                )
+            return self._executor
+
+    def _discard_broken(self) -> None:
+        with self._lock:
+            broken, self._executor = self._executor, None
+            self.fallbacks += 1
+        if broken is not None:
+            broken.shutdown(wait=False, cancel_futures=True)
+
+    def compute(self, big_img: bytes, small_img: bytes) -> int:
+        from concurrent.futures.process import BrokenProcessPool
+
+        with self._slots:
+            with self._lock:
+                self.in_flight += 1
+            try:
+                offset = self._get_executor().submit(calc_slider_offset, big_img, small_img).result()
+            except BrokenProcessPool:
+                self._discard_broken()
+                offset = calc_slider_offset(big_img, small_img)
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+            with self._lock:
+                self.completed += 1
+            return offset
+
+    def _async_slots(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            slots = self._loop_slots.get(loop)
+            if slots is None:
+                slots = self._loop_slots[loop] = asyncio.Semaphore(self.max_pending)
+            return slots
+
+    async def compute_async(self, big_img: bytes, small_img: bytes) -> int:
+        # 异步调用方直接 await 进程池的 future，不再占用默认线程池的线程干等。
+        from concurrent.futures.process import BrokenProcessPool
+
+        async with self._async_slots():
+            with self._lock:
+                self.in_flight += 1
+            try:
+                future = self._get_executor().submit(calc_slider_offset, big_img, small_img)
+                offset = await asyncio.wrap_future(future)
+            except BrokenProcessPool:
+                self._discard_broken()
+                offset = await asyncio.to_thread(calc_slider_offset, big_img, small_img)
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+            with self._lock:
+                self.completed += 1
+            return offset
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "in_flight": self.in_flight,
+                "completed": self.completed,
+                "fallbacks": self.fallbacks,
+            }
+
+
+# ICP_OFFSET_WORKERS > 0 时启用进程池；默认 0，在调用线程里计算。
+_OFFSET_WORKERS = int(os.environ.get("ICP_OFFSET_WORKERS", "0") or 0)
+OFFSET_POOL: OffsetWorkerPool | None = OffsetWorkerPool(_OFFSET_WORKERS) if _OFFSET_WORKERS > 0 else None
+
+
+class DetailShapeLearner:
+    # 记住每个 service_type 最近一次成功的详情请求体字段组合，下次优先尝试；
+    # 同时统计因字段组合不对而浪费的请求数。可选持久化到 JSON 文件，进程重启后沿用。
+    def __init__(self, path: str | Path | None = None) -> None:
+        self.path = Path(path) if path else None
+        self._lock = threading.Lock()
+        self._preferred: dict[str, list[str]] = {}
+        self._stats: dict[str, dict[str, int]] = {}
+        if self.path and self.path.exists():
+            try:
+                loaded = json.loads(self.path.read_text(encoding="utf-8"))
+                if isinstance(loaded, dict):
+                    self._preferred = {str(k): list(v) for k, v in loaded.items() if isinstance(v, list)}
+            except (OSError, ValueError):
+                pass
+
+    @staticmethod
+    def _key(service_type: int | None) -> str:
+        return "any" if service_type is None else str(service_type)
+
+    @staticmethod
+    def _shape(body: dict[str, Any]) -> list[str]:
+        return sorted(body.keys())
+
+    def _counter(self, service_type: int | None) -> dict[str, int]:
+        return self._stats.setdefault(self._key(service_type), {"requests": 0, "success": 0, "wasted": 0})
+
+    def order(self, service_type: int | None, payloads: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        with self._lock:
+            preferred = self._preferred.get(self._key(service_type))
+        if not preferred:
+            return payloads
+        return sorted(payloads, key=lambda body: 0 if self._shape(body) == preferred else 1)
+
+    def record_failure(self, service_type: int | None) -> None:
+        with self._lock:
+            counter = self._counter(service_type)
+            counter["requests"] += 1
+            counter["wasted"] += 1
+
+    def record_success(self, service_type: int | None, body: dict[str, Any]) -> None:
+        shape = self._shape(body)
+        key = self._key(service_type)
+        with self._lock:
+            counter = self._counter(service_type)
+            counter["requests"] += 1
+            counter["success"] += 1
+            if self._preferred.get(key) == shape:
+                return
+            self._preferred[key] = shape
+            # 写文件也在锁内：并发成功时后写入的一定是最新的字段组合，不会被旧快照覆盖。
+            if self.path:
+                try:
+                    self.path.write_text(json.dumps(self._preferred, ensure_ascii=False), encoding="utf-8")
+                except OSError:
+                    pass
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            keys = set(self._stats) | set(self._preferred)
+            return {
+                key: {
+                    "preferred": list(self._preferred.get(key) or []),
+                    **self._stats.get(key, {"requests": 0, "success": 0, "wasted": 0}),
+                }
+                for key in sorted(keys)
+            }
+
+
+DETAIL_SHAPES = DetailShapeLearner(os.environ.get("ICP_DETAIL_SHAPE_FILE") or None)
+# 同一个 dataId 会在多个主体查询、多次翻页中反复出现，详情结果进程内共享。
+DETAIL_CACHE = DetailCache(
+    max_entries=int(os.environ.get("ICP_DETAIL_CACHE_MAX_ENTRIES", DEFAULT_DETAIL_CACHE_MAX_ENTRIES)),
+    ttl=int(os.environ.get("ICP_DETAIL_CACHE_TTL", DEFAULT_CACHE_TTL)),
+    path=os.environ.get("ICP_DETAIL_CACHE_FILE") or None,
+)
+
+
+DEFAULT_HEADERS = {
+    "User-Agent": UA,
+    "Accept": "application/json, text/plain, */*",
+    "Origin": "https://beian.miit.gov.cn",
+    "Referer": "https://beian.miit.gov.cn/",
+    "X-Requested-With": "XMLHttpRequest",
+}
+
+
+def _sanitize_proxy_env() -> None:
+    # 某些环境下会设置无协议代理(如 127.0.0.1:7897)，会让 requests/selenium 直接报错。
+    for key in ("http_proxy", "https_proxy", "HTTP_PROXY", "HTTPS_PROXY"):
+        val = os.environ.get(key, "")
+        if val and "://" not in val:
+            os.environ.pop(key, None)
+    os.environ.setdefault("NO_PROXY", "localhost,127.0.0.1")
+
+
+class _PagePlan:
+    # 翻页决策与传输方式无关，同步/异步客户端共用：
+    # 先按接口给出的 pages 翻页；若不可靠，再用 total/空页兜底。
+    def __init__(self, first: dict[str, Any], max_pages: int) -> None:
+        first_params = first.get("params") or {}
+        first_list = first_params.get("list") or []
+        self.fetched = len(first_list) if isinstance(first_list, list) else 0
+        self.total = MiitIcpClientBase._to_int(first_params.get("total"), self.fetched)
+        pages = max(1, MiitIcpClientBase._to_int(first_params.get("pages"), 1))
+        current_page = max(1, MiitIcpClientBase._to_int(first_params.get("pageNum"), 1))
+        self.limit_pages = max(1, max_pages)
+        self.target_pages = min(pages, self.limit_pages)
+        self.page = current_page + 1
+        self.by_pages = True
+        self.finished = False
+
+    def next_page(self) -> int | None:
+        if self.finished:
+            return None
+        if self.by_pages:
+            if self.page <= self.target_pages:
+                return self.page
+            self.by_pages = False
+        # fallback: 某些场景 pages/nextPage 异常，按 total 继续探测后续页。
+        if self.fetched < self.total and self.page <= self.limit_pages:
+            return self.page
+        return None
+
+    def feed(self, page_data: dict[str, Any]) -> None:
+        page_list = (page_data.get("params") or {}).get("list") or []
+        before = self.fetched
+        if isinstance(page_list, list):
+            self.fetched += len(page_list)
+        stalled = not page_list or self.fetched == before
+        if self.by_pages:
+            if self.fetched >= self.total or stalled:
+                self.by_pages = False
+        elif stalled:
+            self.finished = True
+            return
+        self.page += 1
+
+
+# 同步/异步客户端共用的状态、请求体构造与响应解析，子类只负责收发。
+def _normalize_base_url(base_url: str) -> str:
+    return base_url.rstrip("/") + "/"
+
+
+class MiitIcpClientBase:
+    def __init__(self, transport: str = "curl", base_url: str | None = None) -> None:
+        _sanitize_proxy_env()
+        self.transport = transport
+        self.base_url = _normalize_base_url(base_url or BASE_URL)
         self.token = ""
+        self.token_at = 0.0
         self.uuid = ""
         self.sign = ""
         self.rci = ""
-        self._slide = ddddocr.DdddOcr(det=False, ocr=False, show_ad=False)
+        self.healthy = True
+        self.detail_shapes = DETAIL_SHAPES
+        self.detail_cache: DetailCache | None = DETAIL_CACHE
+
+    def _init_session(self, fixture: str | None, make_session: Callable[[], Any]) -> None:
+        # fixture：replay 时为回放的夹具文件(默认 ICP_REPLAY_FILE)；
+        # curl/requests 时若给出(或设置了 ICP_RECORD_FILE)，则把每个请求/响应录制到该文件。
+        if self.transport == "replay":
+            self.session = ReplaySession(fixture or os.environ.get("ICP_REPLAY_FILE", ""))
+        else:
+            self.session = make_session()
+            record_to = fixture or os.environ.get("ICP_RECORD_FILE", "")
+            if record_to:
+                self.session = RecordingSession(self.session, record_to)
+        self.session.headers.update(DEFAULT_HEADERS)
+
+    @property
+    def _slide(self) -> Any:
+        return get_slide_ocr()
+
+    def export_state(self) -> dict[str, Any]:
+        # 可 JSON 序列化的会话凭据，用于在其它进程/worker 中还原同一查询会话。
+        return {
+            "transport": self.transport,
+            "token": self.token,
+            "token_at": self.token_at,
+            "uuid": self.uuid,
+            "sign": self.sign,
+            "rci": self.rci,
+            "cookies": {k: v for k, v in self.session.cookies.items()},
+        }
+
+    def restore_state(self, state: dict[str, Any]) -> None:
+        self.token = state.get("token") or ""
+        self.token_at = float(state.get("token_at") or 0.0)
+        self.uuid = state.get("uuid") or ""
+        self.sign = state.get("sign") or ""
+        self.rci = state.get("rci") or ""
+        if self.token:
+            self.session.headers["token"] = self.token
+        cookies = state.get("cookies") or {}
+        if cookies:
+            self.session.cookies.update(cookies)
 
     @staticmethod
     def _auth_key(account: str, secret: str, ts_ms: int) -> str:
         return hashlib.md5(f"{account}{secret}{ts_ms}".encode("utf-8")).hexdigest()
 
-    def auth(self, account: str = "test", secret: str = "test") -> str:
+    def _auth_payload(self, account: str, secret: str) -> dict[str, Any]:
         ts_ms = int(time.time() * 1000)
-        payload = {"authKey": self._auth_key(account, secret, ts_ms), "timeStamp": ts_ms}
-        resp = self.session.post(
-            BASE_URL + "auth",
-            data=payload,
-            headers={"Content-Type": "application/x-www-form-urlencoded"},
-            timeout=20,
-        )
+        return {"authKey": self._auth_key(account, secret, ts_ms), "timeStamp": ts_ms}
+
+    def _handle_auth_response(self, resp: Any) -> str:
         if resp.status_code == 403:
             raise RuntimeError("HTTP 403 Forbidden: auth被风控拦截，请稍后重试或更换网络出口")
         resp.raise_for_status()
@@ -80,19 +548,11 @@ class MiitIcpAutoClient:
         if not req_token:
             raise RuntimeError(f"auth response missing token: {data}")
         self.token = req_token
+        self.token_at = time.time()
         self.session.headers["token"] = req_token
         return req_token
 
-    def get_check_images(self, client_uid: str | None = None) -> dict[str, Any]:
-        if not self.token:
-            self.auth()
-        if not client_uid:
-            client_uid = str(uuid.uuid4())
-        resp = self.session.post(
-            BASE_URL + "image/getCheckImagePoint",
-            json={"clientUid": client_uid},
-            timeout=20,
-        )
+    def _handle_check_images_response(self, resp: Any) -> dict[str, Any]:
         resp.raise_for_status()
         data = resp.json()
         params = data.get("params") or {}
@@ -101,90 +561,21 @@ class MiitIcpAutoClient:
             raise RuntimeError(f"getCheckImagePoint failed: {data}")
         return data
 
-    def _calc_offset(self, big_img: bytes, small_img: bytes) -> int:
-        candidates: list[int] = []
-
-        # 1) ddddocr 候选
-        for simple_target in (False, True):
-            try:
-                result = self._slide.slide_match(
-                    target_bytes=small_img,
-                    background_bytes=big_img,
-                    simple_target=simple_target,
-                )
-                target = result.get("target")
-                if isinstance(target, list) and len(target) >= 1:
-                    x = int(target[0])
-                    if 1 <= x <= 435:
-                        candidates.append(x)
-            except Exception:
-                pass
-
-        # 2) OpenCV 掩码模板匹配（一次命中率更高）
-        cv_x: int | None = None
-        try:
-            big_gray = cv2.imdecode(np.frombuffer(big_img, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
-            small_rgba = cv2.imdecode(np.frombuffer(small_img, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
-            if big_gray is not None and small_rgba is not None and len(small_rgba.shape) == 3 and small_rgba.shape[2] == 4:
-                small_gray = cv2.cvtColor(small_rgba[:, :, :3], cv2.COLOR_BGR2GRAY)
-                alpha_mask = small_rgba[:, :, 3]
-                res = cv2.matchTemplate(big_gray, small_gray, cv2.TM_CCORR_NORMED, mask=alpha_mask)
-                _, _, _, max_loc = cv2.minMaxLoc(res)
-                cv_x = int(max_loc[0])
-                if 1 <= cv_x <= 435:
-                    candidates.append(cv_x)
-        except Exception:
-            pass
-
-        # 3) 透明边裁剪后再次 ddddocr，作为补偿候选
-        try:
-            rgba = Image.open(BytesIO(small_img)).convert("RGBA")
-            alpha = np.array(rgba)[:, :, 3]
-            ys, xs = np.where(alpha > 8)
-            if len(xs) > 0 and len(ys) > 0:
-                left, top, right, bottom = xs.min(), ys.min(), xs.max(), ys.max()
-                cropped = rgba.crop((left, top, right + 1, bottom + 1))
-                buf = BytesIO()
-                cropped.save(buf, format="PNG")
-                result = self._slide.slide_match(
-                    target_bytes=buf.getvalue(),
-                    background_bytes=big_img,
-                    simple_target=True,
-                )
-                target = result.get("target")
-                if isinstance(target, list) and len(target) >= 1:
-                    x = int(target[0])
-                    if 1 <= x <= 435:
-                        candidates.append(x)
-        except Exception:
-            pass
-
-        if not candidates:
-            raise RuntimeError("failed to compute slider offset by ddddocr/opencv")
-
-        # 去重后按与 cv_x 的接近程度排序；若无 cv_x，则优先较大的候选（经验上更稳定）
-        uniq = sorted(set(candidates))
-        if cv_x is not None:
-            uniq.sort(key=lambda v: abs(v - cv_x))
-            return uniq[0]
-        return sorted(uniq, reverse=True)[0]
-
-    def verify_slider(self, image_payload: dict[str, Any]) -> tuple[int, str]:
+    @staticmethod
+    def _decode_check_images(image_payload: dict[str, Any]) -> tuple[bytes, bytes]:
         params = image_payload.get("params") or {}
         big_b64 = params.get("bigImage")
         small_b64 = params.get("smallImage")
         if not big_b64 or not small_b64:
             raise RuntimeError(f"captcha image missing: {image_payload}")
+        return base64.b64decode(big_b64), base64.b64decode(small_b64)
 
-        big_img = base64.b64decode(big_b64)
-        small_img = base64.b64decode(small_b64)
-        offset = self._calc_offset(big_img, small_img)
+    def _calc_offset(self, big_img: bytes, small_img: bytes) -> int:
+        if OFFSET_POOL is not None:
+            return OFFSET_POOL.compute(big_img, small_img)
+        return calc_slider_offset(big_img, small_img)
 
-        resp = self.session.post(
-            BASE_URL + "image/checkImage",
-            json={"key": self.uuid, "value": str(offset)},
-            timeout=20,
-        )
+    def _handle_check_image_response(self, resp: Any, offset: int) -> str:
         resp.raise_for_status()
         data = resp.json()
         if not data.get("success"):
@@ -197,27 +588,24 @@ class MiitIcpAutoClient:
             self.sign = params2 or ""
         if not self.sign:
             raise RuntimeError(f"checkImage success but sign missing: {data}")
-        return offset, self.sign
+        return self.sign
 
-    def query_company(
+    def _query_request(
         self,
         company: str,
-        service_type: int = 1,
-        page_num: int | str | None = None,
-        page_size: int | str | None = None,
-    ) -> dict[str, Any]:
+        service_type: int,
+        page_num: int | str | None,
+        page_size: int | str | None,
+    ) -> tuple[dict[str, Any], dict[str, str]]:
         if not self.uuid or not self.sign:
             raise RuntimeError("uuid/sign missing, verify slider first")
         headers = {"uuid": self.uuid, "sign": self.sign}
         body: dict[str, Any] = {"unitName": company, "serviceType": service_type}
         body["pageNum"] = "" if page_num in (None, "") else int(page_num)
         body["pageSize"] = "" if page_size in (None, "") else int(page_size)
-        resp = self.session.post(
-            BASE_URL + "icpAbbreviateInfo/queryByCondition",
-            json=body,
-            headers=headers,
-            timeout=20,
-        )
+        return body, headers
+
+    def _handle_query_response(self, resp: Any) -> dict[str, Any]:
         if resp.status_code == 403:
             waf = "X-Via-JSL" in resp.headers
             body_text = resp.text[:220].replace("\n", " ")
@@ -229,6 +617,10 @@ class MiitIcpAutoClient:
                 )
             raise RuntimeError(f"query http 403: {body_text}")
 
+        if resp.status_code == 401:
+            body_text = resp.text[:220].replace("\n", " ")
+            raise CredentialExpiredError(f"query http 401: {body_text}")
+
         if resp.status_code != 200:
             body_text = resp.text[:220].replace("\n", " ")
             raise RuntimeError(f"query http {resp.status_code}: {body_text}")
@@ -238,6 +630,9 @@ class MiitIcpAutoClient:
             self.rci = resp.headers.get("rci", "") or self.rci
             return data
         snippet = json.dumps(data, ensure_ascii=False)[:400]
+        msg = str(data.get("msg") or "").lower()
+        if data.get("code") == 401 or any(hint in msg for hint in _CREDENTIAL_EXPIRED_HINTS):
+            raise CredentialExpiredError(f"query credential expired: {snippet}")
         raise RuntimeError(f"query business failed: {snippet}")
 
     @staticmethod
@@ -247,57 +642,12 @@ class MiitIcpAutoClient:
         except Exception:
             return default
 
-    def query_company_all(
-        self,
-        company: str,
-        service_type: int = 1,
-        page_size: int = 10,
-        max_pages: int = 2000,
-    ) -> dict[str, Any]:
-        # 同一会话 token + uuid + sign 连续翻页，避免不同 token 下顺序漂移。
-        first = self.query_company(company, service_type, page_num=1, page_size=page_size)
+    @staticmethod
+    def _merge_pages(first: dict[str, Any], all_records: list[Any], page_size: int) -> dict[str, Any]:
         first_params = first.get("params") or {}
         first_list = first_params.get("list") or []
-        all_records: list[Any] = list(first_list) if isinstance(first_list, list) else []
-
-        total = self._to_int(first_params.get("total"), len(all_records))
-        pages = max(1, self._to_int(first_params.get("pages"), 1))
-        current_page = max(1, self._to_int(first_params.get("pageNum"), 1))
-        limit_pages = max(1, max_pages)
-        target_pages = pages
-        if target_pages > limit_pages:
-            target_pages = limit_pages
-
-        # 先按接口给出的 pages 翻页；若不可靠，再用 total/空页兜底。
-        p = current_page + 1
-        while p <= target_pages:
-            page_data = self.query_company(company, service_type, page_num=p, page_size=page_size)
-            page_params = page_data.get("params") or {}
-            page_list = page_params.get("list") or []
-            before = len(all_records)
-            if isinstance(page_list, list):
-                all_records.extend(page_list)
-            after = len(all_records)
-            if after >= total:
-                p += 1
-                break
-            if not page_list or after == before:
-                p += 1
-                break
-            p += 1
-
-        # fallback: 某些场景 pages/nextPage 异常，按 total 继续探测后续页。
-        while len(all_records) < total and p <= limit_pages:
-            page_data = self.query_company(company, service_type, page_num=p, page_size=page_size)
-            page_params = page_data.get("params") or {}
-            page_list = page_params.get("list") or []
-            before = len(all_records)
-            if isinstance(page_list, list):
-                all_records.extend(page_list)
-            after = len(all_records)
-            if not page_list or after == before:
-                break
-            p += 1
+        first_count = len(first_list) if isinstance(first_list, list) else 0
+        total = MiitIcpClientBase._to_int(first_params.get("total"), first_count)
 
         merged = dict(first)
         merged_params = dict(first_params)
@@ -316,7 +666,11 @@ class MiitIcpAutoClient:
         merged["params"] = merged_params
         return merged
 
-    def query_detail_by_app_and_mini_id(self, data_id: int | str, service_type: int | None = None) -> dict[str, Any]:
+    def _detail_request(
+        self,
+        data_id: int | str,
+        service_type: int | None,
+    ) -> tuple[list[dict[str, Any]], dict[str, str]]:
         if not self.uuid or not self.sign:
             raise RuntimeError("uuid/sign missing, verify slider first")
         if not data_id:
@@ -340,31 +694,579 @@ class MiitIcpAutoClient:
                     {"dataId": data_id, "serviceType": service_type},
                 ]
             )
+        return self.detail_shapes.order(service_type, payloads), headers
 
-        last_error = ""
-        for body in payloads:
-            try:
+    @staticmethod
+    def _handle_detail_response(resp: Any) -> tuple[dict[str, Any] | None, str]:
+        if resp.status_code == 403:
+            raise RuntimeError("HTTP 403 Forbidden: detail被风控拦截")
+        resp.raise_for_status()
+        data = resp.json()
+        if data.get("success") or data.get("code") == 200:
+            return data, ""
+        msg = str(data.get("msg") or "").lower()
+        if data.get("code") == 401 or any(hint in msg for hint in _CREDENTIAL_EXPIRED_HINTS):
+            raise CredentialExpiredError(f"detail credential expired: code={data.get('code')} msg={data.get('msg')}")
+        return None, f"code={data.get('code')} msg={data.get('msg')}"
+
+
+class MiitIcpAutoClient(MiitIcpClientBase):
+    def __init__(self, transport: str = "curl", base_url: str | None = None, fixture: str | None = None) -> None:
+        super().__init__(transport, base_url)
+        if transport == "curl":
+            self._init_session(fixture, functools.partial(curl_requests.Session, impersonate="chrome124"))
+        else:
+            self._init_session(fixture, requests.Session)
+
+    def close(self) -> None:
+        self.session.close()
+
+    @_instrumented("auth")
+    def auth(self, account: str = "test", secret: str = "test") -> str:
+        resp = self.session.post(
+            self.base_url + "auth",
+            data=self._auth_payload(account, secret),
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+            timeout=20,
+        )
+        return self._handle_auth_response(resp)
+
+    @_instrumented("check_images")
+    def get_check_images(self, client_uid: str | None = None) -> dict[str, Any]:
+        if not self.token:
+            self.auth()
+        if not client_uid:
+            client_uid = str(uuid.uuid4())
+        resp = self.session.post(
+            self.base_url + "image/getCheckImagePoint",
+            json={"clientUid": client_uid},
+            timeout=20,
+        )
+        return self._handle_check_images_response(resp)
+
+    @_instrumented("verify_slider")
+    def verify_slider(self, image_payload: dict[str, Any]) -> tuple[int, str]:
+        big_img, small_img = self._decode_check_images(image_payload)
+        offset = self._calc_offset(big_img, small_img)
+
+        resp = self.session.post(
+            self.base_url + "image/checkImage",
+            json={"key": self.uuid, "value": str(offset)},
+            timeout=20,
+        )
+        return offset, self._handle_check_image_response(resp, offset)
+
+    @_instrumented("query_page")
+    def query_company(
+        self,
+        company: str,
+        service_type: int = 1,
+        page_num: int | str | None = None,
+        page_size: int | str | None = None,
+    ) -> dict[str, Any]:
+        body, headers = self._query_request(company, service_type, page_num, page_size)
+        resp = self.session.post(
+            self.base_url + "icpAbbreviateInfo/queryByCondition",
+            json=body,
+            headers=headers,
+            timeout=20,
+        )
+        return self._handle_query_response(resp)
+
+    def iter_company_pages(
+        self,
+        company: str,
+        service_type: int = 1,
+        page_size: int = 10,
+        max_pages: int = 2000,
+    ) -> Iterator[dict[str, Any]]:
+        # 同一会话 token + uuid + sign 连续翻页，避免不同 token 下顺序漂移。
+        # 逐页 yield 原始响应，调用方可边取边处理，不必把所有记录留在内存里。
+        first = self.query_company(company, service_type, page_num=1, page_size=page_size)
+        yield first
+        plan = _PagePlan(first, max_pages)
+        page_num = plan.next_page()
+        while page_num is not None:
+            page_data = self.query_company(company, service_type, page_num=page_num, page_size=page_size)
+            plan.feed(page_data)
+            yield page_data
+            page_num = plan.next_page()
+
+    def iter_company_records(
+        self,
+        company: str,
+        service_type: int = 1,
+        page_size: int = 10,
+        max_pages: int = 2000,
+    ) -> Iterator[Any]:
+        for page_data in self.iter_company_pages(company, service_type, page_size=page_size, max_pages=max_pages):
+            page_list = (page_data.get("params") or {}).get("list") or []
+            if isinstance(page_list, list):
+                yield from page_list
+
+    @_instrumented("query_all")
+    def query_company_all(
+        self,
+        company: str,
+        service_type: int = 1,
+        page_size: int = 10,
+        max_pages: int = 2000,
+    ) -> dict[str, Any]:
+        first: dict[str, Any] = {}
+        all_records: list[Any] = []
+        pages = 0
+        for page_data in self.iter_company_pages(company, service_type, page_size=page_size, max_pages=max_pages):
+            pages += 1
+            if not first:
+                first = page_data
+            page_list = (page_data.get("params") or {}).get("list") or []
+            if isinstance(page_list, list):
+                all_records.extend(page_list)
+        QUERY_PAGES.observe(pages)
+        return self._merge_pages(first, all_records, page_size)
+
+    def query_detail_by_app_and_mini_id(self, data_id: int | str, service_type: int | None = None) -> dict[str, Any]:
+        # 先查详情缓存：命中时不需要已验证的会话，也不必构造请求体。
+        if self.detail_cache is not None:
+            cached = self.detail_cache.get(data_id, service_type)
+            if cached is not None:
+                return cached
+        payloads, headers = self._detail_request(data_id, service_type)
+        with _observe_stage("query_detail", owner=self):
+            last_error = ""
+            for body in payloads:
+                # 只有上游返回业务错误码才说明字段组合被拒，换下一种请求体重试；
+                # 403/凭据失效/网络异常与请求体无关，直接抛出，由 _observe_stage 计入对应结果并标记客户端。
                 resp = self.session.post(
-                    BASE_URL + "icpAbbreviateInfo/queryDetailByAppAndMiniId",
+                    self.base_url + "icpAbbreviateInfo/queryDetailByAppAndMiniId",
                     json=body,
                     headers=headers,
                     timeout=20,
                 )
-                if resp.status_code == 403:
-                    raise RuntimeError("HTTP 403 Forbidden: detail被风控拦截")
-                resp.raise_for_status()
-                data = resp.json()
-                if data.get("success") or data.get("code") == 200:
+                data, last_error = self._handle_detail_response(resp)
+                if data is not None:
+                    self.detail_shapes.record_success(service_type, body)
+                    if self.detail_cache is not None:
+                        self.detail_cache.put(data_id, service_type, data)
                     return data
-                last_error = f"code={data.get('code')} msg={data.get('msg')}"
-            except Exception as exc:
-                last_error = str(exc)
+                self.detail_shapes.record_failure(service_type)
+                RETRIES.inc("detail_shape")
+
+            raise RuntimeError(f"queryDetailByAppAndMiniId failed: {last_error}")
+
+
+class AsyncMiitIcpAutoClient(MiitIcpClientBase):
+    # asyncio 版本，接口与 MiitIcpAutoClient 一致；curl 通道使用 curl_cffi AsyncSession，
+    # requests 通道没有原生异步实现，放到线程里执行；replay 直接读内存中的夹具。滑块识别属于 CPU 计算，启用进程池时直接 await 进程池，否则放到线程。
+    def __init__(self, transport: str = "curl", base_url: str | None = None, fixture: str | None = None) -> None:
+        super().__init__(transport, base_url)
+        if transport == "curl":
+            self._init_session(fixture, functools.partial(curl_requests.AsyncSession, impersonate="chrome124"))
+        else:
+            self._init_session(fixture, requests.Session)
+
+    async def _post(self, url: str, **kwargs: Any) -> Any:
+        if self.transport == "curl":
+            return await self.session.post(url, **kwargs)
+        if self.transport == "replay":
+            return self.session.post(url, **kwargs)
+        return await asyncio.to_thread(self.session.post, url, **kwargs)
+
+    async def close(self) -> None:
+        if self.transport == "curl":
+            await self.session.close()
+        else:
+            self.session.close()
+
+    @_instrumented("auth")
+    async def auth(self, account: str = "test", secret: str = "test") -> str:
+        resp = await self._post(
+            self.base_url + "auth",
+            data=self._auth_payload(account, secret),
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+            timeout=20,
+        )
+        return self._handle_auth_response(resp)
+
+    @_instrumented("check_images")
+    async def get_check_images(self, client_uid: str | None = None) -> dict[str, Any]:
+        if not self.token:
+            await self.auth()
+        if not client_uid:
+            client_uid = str(uuid.uuid4())
+        resp = await self._post(
+            self.base_url + "image/getCheckImagePoint",
+            json={"clientUid": client_uid},
+            timeout=20,
+        )
+        return self._handle_check_images_response(resp)
+
+    @_instrumented("verify_slider")
+    async def verify_slider(self, image_payload: dict[str, Any]) -> tuple[int, str]:
+        big_img, small_img = self._decode_check_images(image_payload)
+        if OFFSET_POOL is not None:
+            offset = await OFFSET_POOL.compute_async(big_img, small_img)
+        else:
+            offset = await asyncio.to_thread(calc_slider_offset, big_img, small_img)
+
+        resp = await self._post(
+            self.base_url + "image/checkImage",
+            json={"key": self.uuid, "value": str(offset)},
+            timeout=20,
+        )
+        return offset, self._handle_check_image_response(resp, offset)
+
+    @_instrumented("query_page")
+    async def query_company(
+        self,
+        company: str,
+        service_type: int = 1,
+        page_num: int | str | None = None,
+        page_size: int | str | None = None,
+    ) -> dict[str, Any]:
+        body, headers = self._query_request(company, service_type, page_num, page_size)
+        resp = await self._post(
+            self.base_url + "icpAbbreviateInfo/queryByCondition",
+            json=body,
+            headers=headers,
+            timeout=20,
+        )
+        return self._handle_query_response(resp)
+
+    async def iter_company_pages(
+        self,
+        company: str,
+        service_type: int = 1,
+        page_size: int = 10,
+        max_pages: int = 2000,
+    ) -> AsyncIterator[dict[str, Any]]:
+        first = await self.query_company(company, service_type, page_num=1, page_size=page_size)
+        yield first
+        plan = _PagePlan(first, max_pages)
+        page_num = plan.next_page()
+        while page_num is not None:
+            page_data = await self.query_company(company, service_type, page_num=page_num, page_size=page_size)
+            plan.feed(page_data)
+            yield page_data
+            page_num = plan.next_page()
+
+    async def iter_company_records(
+        self,
+        company: str,
+        service_type: int = 1,
+        page_size: int = 10,
+        max_pages: int = 2000,
+    ) -> AsyncIterator[Any]:
+        async for page_data in self.iter_company_pages(company, service_type, page_size=page_size, max_pages=max_pages):
+            page_list = (page_data.get("params") or {}).get("list") or []
+            if isinstance(page_list, list):
+                for rec in page_list:
+                    yield rec
+
+    @_instrumented("query_all")
+    async def query_company_all(
+        self,
+        company: str,
+        service_type: int = 1,
+        page_size: int = 10,
+        max_pages: int = 2000,
+    ) -> dict[str, Any]:
+        first: dict[str, Any] = {}
+        all_records: list[Any] = []
+        pages = 0
+        async for page_data in self.iter_company_pages(company, service_type, page_size=page_size, max_pages=max_pages):
+            pages += 1
+            if not first:
+                first = page_data
+            page_list = (page_data.get("params") or {}).get("list") or []
+            if isinstance(page_list, list):
+                all_records.extend(page_list)
+        QUERY_PAGES.observe(pages)
+        return self._merge_pages(first, all_records, page_size)
+
+    async def query_detail_by_app_and_mini_id(
+        self,
+        data_id: int | str,
+        service_type: int | None = None,
+    ) -> dict[str, Any]:
+        # 先查详情缓存：命中时不需要已验证的会话，也不必构造请求体。
+        if self.detail_cache is not None:
+            cached = self.detail_cache.get(data_id, service_type)
+            if cached is not None:
+                return cached
+        payloads, headers = self._detail_request(data_id, service_type)
+        with _observe_stage("query_detail", owner=self):
+            last_error = ""
+            for body in payloads:
+                # 只有上游返回业务错误码才说明字段组合被拒，换下一种请求体重试；
+                # 403/凭据失效/网络异常与请求体无关，直接抛出，由 _observe_stage 计入对应结果并标记客户端。
+                resp = await self._post(
+                    self.base_url + "icpAbbreviateInfo/queryDetailByAppAndMiniId",
+                    json=body,
+                    headers=headers,
+                    timeout=20,
+                )
+                data, last_error = self._handle_detail_response(resp)
+                if data is not None:
+                    self.detail_shapes.record_success(service_type, body)
+                    if self.detail_cache is not None:
+                        self.detail_cache.put(data_id, service_type, data)
+                    return data
+                self.detail_shapes.record_failure(service_type)
+                RETRIES.inc("detail_shape")
+
+            raise RuntimeError(f"queryDetailByAppAndMiniId failed: {last_error}")
+
+
+DEFAULT_POOL_MAX_IDLE = 8
+DEFAULT_POOL_IDLE_TTL = 5 * 60
+DEFAULT_POOL_TOKEN_TTL = 10 * 60
+# 同时借出的客户端上限(含分页会话占用的)，超出时等待归还，超时报 PoolExhaustedError。
+DEFAULT_POOL_MAX_SIZE = 256
+DEFAULT_POOL_ACQUIRE_TIMEOUT = 30
+
+
+class AsyncClientPool:
+    # 复用已建连、已鉴权的异步客户端，避免每个请求都新建 HTTP 会话并重新 auth。
+    # 只在单个事件循环内使用；最多保留 max_idle 个空闲客户端，空闲超过 idle_ttl 的直接关闭。
+    # 同时借出的客户端不超过 max_size 个，突发请求排队等待而不是无限新建、鉴权。
+    # 借出时检查 token 是否超过 token_ttl，过期则先重新 auth；遇到过 403/凭据失效的客户端不再复用。
+    def __init__(
+        self,
+        max_idle: int = DEFAULT_POOL_MAX_IDLE,
+        idle_ttl: int = DEFAULT_POOL_IDLE_TTL,
+        token_ttl: int = DEFAULT_POOL_TOKEN_TTL,
+        max_size: int = DEFAULT_POOL_MAX_SIZE,
+        acquire_timeout: float = DEFAULT_POOL_ACQUIRE_TIMEOUT,
+    ) -> None:
+        self.max_idle = max(0, max_idle)
+        self.idle_ttl = idle_ttl
+        self.token_ttl = token_ttl
+        self.max_size = max(1, max_size)
+        self.acquire_timeout = acquire_timeout
+        self._slots = asyncio.Semaphore(self.max_size)
+        self._idle: dict[str, list[tuple[float, AsyncMiitIcpAutoClient]]] = {}
+        self._out: set[AsyncMiitIcpAutoClient] = set()
+        self.waiting = 0
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+
+    def _token_fresh(self, client: AsyncMiitIcpAutoClient) -> bool:
+        return bool(client.token) and time.time() - client.token_at < self.token_ttl
+
+    async def _take_slot(self) -> None:
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            raise PoolExhaustedError(f"client pool exhausted: {self.max_size} clients in use") from None
+        finally:
+            self.waiting -= 1
+
+    async def acquire(self, transport: str = "curl") -> AsyncMiitIcpAutoClient:
+        await self._take_slot()
+        try:
+            client = await self._checkout(transport)
+        except BaseException:
+            self._slots.release()
+            raise
+        self._out.add(client)
+        return client
+
+    async def _checkout(self, transport: str) -> AsyncMiitIcpAutoClient:
+        # 空闲列表只做原地修改：reap()/close() 与这里交错执行时不会出现同一客户端既被借出又留在空闲列表。
+        idle = self._idle.setdefault(transport, [])
+        client: AsyncMiitIcpAutoClient | None = None
+        while idle:
+            released_at, candidate = idle.pop()
+            if time.time() - released_at > self.idle_ttl or not candidate.healthy:
+                self.discarded += 1
+                await candidate.close()
                 continue
+            client = candidate
+            self.reused += 1
+            break
+        if client is None:
+            client = AsyncMiitIcpAutoClient(transport=transport)
+            self.created += 1
+        if not self._token_fresh(client):
+            try:
+                await client.auth()
+            except Exception:
+                self.discarded += 1
+                await client.close()
+                raise
+        return client
+
+    async def release(self, client: AsyncMiitIcpAutoClient, reusable: bool = True) -> None:
+        if client not in self._out:
+            return
+        self._out.discard(client)
+        self._slots.release()
+        # 验证码结果只对单次查询有效，归还时清掉；token 和连接保留给下一个借用者。
+        client.uuid = ""
+        client.sign = ""
+        client.rci = ""
+        idle = self._idle.setdefault(client.transport, [])
+        if not reusable or not client.healthy or sum(len(v) for v in self._idle.values()) >= self.max_idle:
+            self.discarded += 1
+            await client.close()
+            return
+        idle.append((time.time(), client))
+
+    async def reap(self) -> int:
+        cutoff = time.time() - self.idle_ttl
+        closed = 0
+        for idle in self._idle.values():
+            expired = [c for ts, c in idle if ts < cutoff]
+            idle[:] = [(ts, c) for ts, c in idle if ts >= cutoff]
+            for c in expired:
+                closed += 1
+                await c.close()
+        self.discarded += closed
+        return closed
+
+    async def close(self) -> None:
+        for idle in self._idle.values():
+            clients = [c for _, c in idle]
+            idle.clear()
+            for c in clients:
+                await c.close()
 
-        raise RuntimeError(f"queryDetailByAppAndMiniId failed: {last_error}")
+    def stats(self) -> dict[str, int]:
+        return {
+            "idle": sum(len(v) for v in self._idle.values()),
+            "in_use": len(self._out),
+            "waiting": self.waiting,
+            "max_idle": self.max_idle,
+            "max_size": self.max_size,
+            "created": self.created,
+            "reused": self.reused,
+            "discarded": self.discarded,
+        }
+
+
+def load_jsonl_done_queries(path: Path) -> set[str]:
+    # 续跑时只跳过已成功的查询词；崩溃时写了一半的末行解析失败直接忽略。
+    done: set[str] = set()
+    if not path.exists():
+        return done
+    with path.open("r", encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(row, dict) and row.get("ok") and row.get("query"):
+                done.add(str(row["query"]))
+    return done
+
+
+def open_jsonl_output(path: Path, resume: bool) -> Any:
+    if not resume or not path.exists():
+        return path.open("w", encoding="utf-8")
+    with path.open("rb") as fh:
+        fh.seek(0, os.SEEK_END)
+        needs_newline = False
+        if fh.tell() > 0:
+            fh.seek(-1, os.SEEK_END)
+            needs_newline = fh.read(1) != b"\n"
+    out = path.open("a", encoding="utf-8")
+    if needs_newline:
+        out.write("\n")
+    return out
+
+
+def _query_upstream(
+    keyword: str,
+    service_type: int,
+    transport: str,
+    retries: int,
+    base_url: str | None = None,
+    page_size: int = 10,
+    max_pages: int = 2000,
+) -> dict[str, Any]:
+    client = MiitIcpAutoClient(transport=transport, base_url=base_url)
+    try:
+        client.auth()
+        last_err: Exception | None = None
+        for _ in range(max(1, retries)):
+            try:
+                client.verify_slider(client.get_check_images())
+                break
+            except Exception as exc:
+                last_err = exc
+                RETRIES.inc("captcha")
+                time.sleep(0.4)
+        else:
+            raise RuntimeError(f"captcha verify failed after retries: {last_err}")
+        return client.query_company_all(
+            keyword, service_type=service_type, page_size=max(1, page_size), max_pages=max(1, max_pages)
+        )
+    finally:
+        client.close()
+
+
+def index_main(argv: list[str]) -> None:
+    parser = argparse.ArgumentParser(prog="miit_icp_auto_query.py index", description="本地备案记录索引")
+    parser.add_argument("--index-file", default=DEFAULT_INDEX_FILE, help="索引文件")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="从结果缓存文件回填索引")
+    build.add_argument("--cache-file", default=DEFAULT_CACHE_FILE, help="结果缓存文件")
+
+    search = sub.add_parser("search", help="按域名/主体名称/备案号检索本地索引")
+    search.add_argument("term", help="检索词")
+    search.add_argument("--mode", choices=SEARCH_MODES, default="auto", help="auto 依次尝试精确、前缀、子串")
+    search.add_argument("--service-type", type=int, default=None, help="只查指定类型，默认不限")
+    search.add_argument("--limit", type=int, default=DEFAULT_SEARCH_LIMIT, help="最多返回条数")
+    search.add_argument("--fallback", action="store_true", help="本地未命中时实时查询工信部接口并写入索引")
+    search.add_argument("--transport", choices=["curl", "requests"], default="curl", help="fallback 使用的通道")
+    search.add_argument("--retries", type=int, default=5, help="fallback 验证码重试次数")
+    search.add_argument("--page-size", type=int, default=10, help="fallback 每页条数")
+    search.add_argument("--max-pages", type=int, default=2000, help="fallback 最多翻页数")
+    search.add_argument("--base-url", default=BASE_URL, help="fallback 使用的接口地址")
+    args = parser.parse_args(argv)
+
+    index = RecordIndex(args.index_file)
+    if args.command == "build":
+        if not Path(args.cache_file).exists():
+            parser.error(f"缓存文件不存在: {args.cache_file}")
+        count = index.import_result_cache(args.cache_file)
+        print(f"[+] 已写入 {count} 条记录，索引共 {len(index)} 条: {args.index_file}")
+        return
+
+    started = time.perf_counter()
+    mode, records = index.search(args.term, mode=args.mode, service_type=args.service_type, limit=args.limit)
+    source = "index"
+    if not records and args.fallback:
+        service_type = args.service_type or 1
+        raw = _query_upstream(
+            args.term,
+            service_type,
+            args.transport,
+            args.retries,
+            args.base_url,
+            page_size=args.page_size,
+            max_pages=args.max_pages,
+        )
+        index.add_result(args.term, service_type, raw)
+        records = ((raw.get("params") or {}).get("list") or [])[: max(1, args.limit)]
+        source = "upstream"
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    print(f"[+] {source}/{mode}: {len(records)} 条，耗时 {elapsed_ms:.1f} ms", file=sys.stderr)
+    print(json.dumps(records, ensure_ascii=False, indent=2))
 
 
 def main() -> None:
+    if len(sys.argv) > 1 and sys.argv[1] == "index":
+        index_main(sys.argv[2:])
+        return
+
     parser = argparse.ArgumentParser(description="??????? ICP ???????/???")
     parser.add_argument("query", nargs="?", help="?????????????")
     parser.add_argument("--company", default="", help="???????????")
@@ -375,12 +1277,103 @@ def main() -> None:
     parser.add_argument("--max-pages", type=int, default=2000, help="????????????")
     parser.add_argument("--retries", type=int, default=5, help="???????")
     parser.add_argument("--manual-offset", type=int, default=-1, help="???????????")
-    parser.add_argument("--transport", choices=["curl", "requests"], default="curl", help="????")
+    parser.add_argument("--transport", choices=list(TRANSPORTS), default="curl", help="????")
+    parser.add_argument(
+        "--fixture",
+        default="",
+        help="replay 时回放的夹具文件；curl/requests 时把请求/响应录制到该文件(.gz 结尾则压缩)",
+    )
+    parser.add_argument("--base-url", default=BASE_URL, help="接口地址，可指向本地模拟服务(默认取 ICP_BASE_URL 或工信部线上地址)")
+    parser.add_argument("--cache-file", default=DEFAULT_CACHE_FILE, help="本地结果缓存文件，传空字符串关闭缓存")
+    parser.add_argument("--max-age", type=int, default=DEFAULT_CACHE_TTL, help="缓存最大可用时长(秒)，0 表示不读缓存")
+    parser.add_argument("--cache-ttl", type=int, default=DEFAULT_CACHE_TTL, help="缓存保留时长(秒)，超过后在写入时清理")
+    parser.add_argument("--refresh", action="store_true", help="忽略已有缓存强制查询，并用新结果覆盖缓存")
+    parser.add_argument("--index-file", default=DEFAULT_INDEX_FILE, help="查询结果写入的本地索引文件，传空字符串关闭")
+    parser.add_argument("--cache-max-entries", type=int, default=DEFAULT_CACHE_MAX_ENTRIES, help="缓存最多保留条数")
+    parser.add_argument("--reuse-session", action="store_true", help="批量时复用同一客户端与验证结果，凭据失效才重新鉴权")
+    parser.add_argument(
+        "--format",
+        choices=["json", "jsonl", "csv", *BINARY_EXPORTS],
+        default="json",
+        help="输出格式，jsonl 每完成一条立即写出；csv/xlsx/parquet/arrow 每条备案记录一行",
+    )
+    parser.add_argument("--resume", action="store_true", help="配合 --format jsonl --output 使用，跳过输出文件中已成功的查询")
+    parser.add_argument("--profile", action="store_true", help="记录各阶段耗时，结束时在 stderr 输出瀑布图与汇总")
+    parser.add_argument("--profile-pstats", default="", help="同时用 cProfile 采样并写入该 pstats 文件")
+    parser.add_argument("--profile-trace", default="", help="把各阶段 span 写成 Chrome trace JSON(chrome://tracing/Perfetto 打开)")
     args = parser.parse_args()
+    if args.format in BINARY_EXPORTS:
+        if not args.output:
+            parser.error(f"--format {args.format} 需要同时指定 --output")
+        package = BINARY_EXPORTS[args.format][1]
+        if importlib.util.find_spec(package) is None:
+            parser.error(f"--format {args.format} 需要安装 {package}: pip install {package}")
 
-    def run_one(query_word: str) -> dict[str, Any]:
-        client = MiitIcpAutoClient(transport=args.transport)
+    if not (args.profile or args.profile_pstats or args.profile_trace):
+        run_cli(parser, args)
+        return
+
+    profiler = start_profiling()
+    cprof = None
+    if args.profile_pstats:
+        import cProfile
+
+        cprof = cProfile.Profile()
+        cprof.enable()
+    try:
+        run_cli(parser, args)
+    finally:
+        if cprof is not None:
+            cprof.disable()
+            cprof.dump_stats(args.profile_pstats)
+        stop_profiling()
+        print("[profile] 各阶段瀑布图:", file=sys.stderr)
+        print(profiler.waterfall(), file=sys.stderr)
+        print("[profile] 按阶段汇总:", file=sys.stderr)
+        print(profiler.totals(), file=sys.stderr)
+        if args.profile_trace:
+            profiler.write_chrome_trace(args.profile_trace)
+            print(f"[profile] Chrome trace 已写入: {args.profile_trace}", file=sys.stderr)
+        if args.profile_pstats:
+            print(f"[profile] pstats 已写入: {args.profile_pstats}", file=sys.stderr)
+
+
+def run_cli(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    # 结果写到 stdout 时(jsonl/csv 未指定 --output)，进度日志改走 stderr，保证 stdout 可直接被管道消费。
+    def log_stderr(msg: str) -> None:
+        print(msg, file=sys.stderr)
+
+    csv_to_stdout = args.format == "csv" and not args.output
+
+    def write_table_output(rows: list[dict[str, Any]]) -> None:
+        export_rows = [export_row_from_cli(row) for row in rows]
+        if args.format == "csv":
+            if args.output:
+                write_csv(Path(args.output), export_rows)
+            else:
+                for chunk in iter_csv_chunks(export_rows, bom=False):
+                    sys.stdout.write(chunk.decode("utf-8"))
+                return
+        else:
+            Path(args.output).write_bytes(BINARY_EXPORTS[args.format][0](export_rows))
+        print(f"[+] 结果已导出: {args.output}")
+
+    cache: ResultCache | None = None
+    if args.cache_file:
+        cache = ResultCache(
+            args.cache_file,
+            ttl=max(0, args.cache_ttl),
+            max_entries=max(1, args.cache_max_entries),
+        )
+
+    index = RecordIndex(args.index_file) if args.index_file else None
+
+    stats = {"auth_calls": 0, "upstream_queries": 0}
+    shared: dict[str, Any] = {"client": None, "offset": -1}
+
+    def verify_client(client: MiitIcpAutoClient) -> int:
         client.auth()
+        stats["auth_calls"] += 1
 
         last_err: Exception | None = None
         used_offset = -1
@@ -389,7 +1382,7 @@ def main() -> None:
             client.uuid = (images.get("params") or {}).get("uuid", "")
             used_offset = int(args.manual_offset)
             resp = client.session.post(
-                BASE_URL + "image/checkImage",
+                client.base_url + "image/checkImage",
                 json={"key": client.uuid, "value": str(used_offset)},
                 timeout=20,
             )
@@ -401,23 +1394,64 @@ def main() -> None:
             if not client.sign:
                 raise RuntimeError(f"manual offset sign missing: {data}")
         else:
-            for _ in range(max(1, args.retries)):
+            for attempt in range(1, max(1, args.retries) + 1):
                 try:
-                    images = client.get_check_images(client_uid=str(uuid.uuid4()))
-                    used_offset, _ = client.verify_slider(images)
+                    with span("captcha_attempt", attempt=attempt):
+                        images = client.get_check_images(client_uid=str(uuid.uuid4()))
+                        used_offset, _ = client.verify_slider(images)
                     break
                 except Exception as exc:
                     last_err = exc
+                    RETRIES.inc("captcha")
                     time.sleep(0.4)
             else:
                 raise RuntimeError(f"captcha verify failed after retries: {last_err}")
+        return used_offset
 
-        result = client.query_company_all(
+    def query_all(client: MiitIcpAutoClient, query_word: str) -> dict[str, Any]:
+        return client.query_company_all(
             query_word,
             service_type=args.service_type,
             page_size=max(1, args.page_size),
             max_pages=max(1, args.max_pages),
         )
+
+    # 结果最多覆盖的记录条数；缓存里不完整的结果只有覆盖到该深度才命中。
+    depth = max(1, args.max_pages) * max(1, args.page_size)
+
+    def run_one(query_word: str) -> dict[str, Any]:
+        if cache is not None and not args.refresh:
+            with span("cache_lookup"):
+                cached = cache.get(query_word, args.service_type, max_age=args.max_age, depth=depth)
+            if cached is not None:
+                return {"query": query_word, "offset": -1, "ok": True, "cached": True, "result": cached}
+
+        stats["upstream_queries"] += 1
+        if args.reuse_session:
+            # 整批共用一个客户端和 token/uuid/sign，仅在上游判定凭据失效时重新鉴权。
+            if shared["client"] is None:
+                with span("client_init"):
+                    client = MiitIcpAutoClient(transport=args.transport, base_url=args.base_url, fixture=args.fixture or None)
+                shared["offset"] = verify_client(client)
+                shared["client"] = client
+            client = shared["client"]
+            try:
+                result = query_all(client, query_word)
+            except CredentialExpiredError:
+                RETRIES.inc("reauth")
+                shared["offset"] = verify_client(client)
+                result = query_all(client, query_word)
+            used_offset = shared["offset"]
+        else:
+            with span("client_init"):
+                client = MiitIcpAutoClient(transport=args.transport, base_url=args.base_url, fixture=args.fixture or None)
+            used_offset = verify_client(client)
+            result = query_all(client, query_word)
+
+        if cache is not None:
+            cache.put(query_word, args.service_type, result, depth=depth)
+        if index is not None:
+            index.add_result(query_word, args.service_type, result)
         return {"query": query_word, "offset": used_offset, "ok": True, "result": result}
 
     if args.input:
@@ -429,21 +1463,63 @@ def main() -> None:
         queries = [line.strip() for line in input_path.read_text(encoding="utf-8").splitlines() if line.strip()]
         if not queries:
             parser.error("input ?????????")
+        if args.resume and (args.format != "jsonl" or not args.output):
+            parser.error("--resume 需要同时指定 --format jsonl 和 --output")
+
+        def run_batch(emit: Any, log: Any, done: set[str]) -> None:
+            for idx2, q in enumerate(queries, start=1):
+                if q in done:
+                    log(f"[{idx2}/{len(queries)}] SKIP: {q} (已在输出文件中)")
+                    continue
+                try:
+                    with span("query", query=q):
+                        row = run_one(q)
+                    source = "cache" if row.get("cached") else f"offset={row['offset']}"
+                    log(f"[{idx2}/{len(queries)}] OK: {q} ({source})")
+                except Exception as exc:
+                    row = {"query": q, "ok": False, "error": str(exc)}
+                    log(f"[{idx2}/{len(queries)}] FAIL: {q} -> {exc}")
+                emit(row)
+
+            if args.reuse_session:
+                saved = max(0, stats["upstream_queries"] - stats["auth_calls"])
+                log(f"[+] auth 调用 {stats['auth_calls']} 次，复用会话节省 {saved} 次")
+
+        if args.format == "jsonl":
+            # 流式输出：每条结果写完即 flush，内存占用与批量大小无关，中断后可 --resume 续跑。
+            out_path = Path(args.output) if args.output else None
+            done = load_jsonl_done_queries(out_path) if (out_path and args.resume) else set()
+            out = open_jsonl_output(out_path, args.resume) if out_path else sys.stdout
+            log = print if out_path else log_stderr
+
+            def emit_jsonl(row: dict[str, Any]) -> None:
+                with span("serialise", query=row.get("query")):
+                    out.write(json.dumps(row, ensure_ascii=False) + "\n")
+                    out.flush()
 
-        all_results: list[dict[str, Any]] = []
-        for idx2, q in enumerate(queries, start=1):
             try:
-                row = run_one(q)
-                print(f"[{idx2}/{len(queries)}] OK: {q} (offset={row['offset']})")
-            except Exception as exc:
-                row = {"query": q, "ok": False, "error": str(exc)}
-                print(f"[{idx2}/{len(queries)}] FAIL: {q} -> {exc}")
-            all_results.append(row)
+                run_batch(emit_jsonl, log, done)
+            finally:
+                if out_path:
+                    out.close()
+            if out_path:
+                print(f"[+] ???????: {out_path}")
+            return
+
+        all_results: list[dict[str, Any]] = []
+        run_batch(all_results.append, log_stderr if csv_to_stdout else print, set())
 
-        text_out = json.dumps(all_results, ensure_ascii=False, indent=2)
+        if args.format == "csv" or args.format in BINARY_EXPORTS:
+            with span("serialise"):
+                write_table_output(all_results)
+            return
+
+        with span("serialise"):
+            text_out = json.dumps(all_results, ensure_ascii=False, indent=2)
         if args.output:
             out_path = Path(args.output)
-            out_path.write_text(text_out, encoding="utf-8")
+            with span("write_output"):
+                out_path.write_text(text_out, encoding="utf-8")
             print(f"[+] ???????: {out_path}")
         else:
             print(text_out)
@@ -453,9 +1529,26 @@ def main() -> None:
     if not query:
         parser.error("?????????? --input ????")
 
-    one = run_one(query)
-    print(f"[+] captcha offset = {one['offset']}")
-    print(json.dumps(one["result"], ensure_ascii=False, indent=2))
+    with span("query", query=query):
+        one = run_one(query)
+    log = log_stderr if (csv_to_stdout or (args.format == "jsonl" and not args.output)) else print
+    if one.get("cached"):
+        log("[+] 命中本地缓存，未请求工信部接口")
+    else:
+        log(f"[+] captcha offset = {one['offset']}")
+    with span("serialise"):
+        if args.format == "jsonl" and args.output:
+            # 与批量 jsonl 一致：写入 --output，带 --resume 时追加。
+            out_path = Path(args.output)
+            with open_jsonl_output(out_path, args.resume) as out:
+                out.write(json.dumps(one, ensure_ascii=False) + "\n")
+            print(f"[+] 结果已导出: {out_path}")
+        elif args.format == "jsonl":
+            print(json.dumps(one, ensure_ascii=False))
+        elif args.format == "csv" or args.format in BINARY_EXPORTS:
+            write_table_output([one])
+        else:
+            print(json.dumps(one["result"], ensure_ascii=False, indent=2))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,299 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+
+DEFAULT_CACHE_FILE = "icp_cache.sqlite3"
+DEFAULT_CACHE_TTL = 24 * 3600
+DEFAULT_CACHE_MAX_ENTRIES = 5000
+DEFAULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+
+# query_company_all 结果的本地 SQLite 缓存，按 (keyword, service_type) 存取。
+# 受 max_pages 截断的结果记下覆盖深度(max_pages * page_size 条)，只给不超过该深度的查询命中。
+class ResultCache:
+    def __init__(
+        self,
+        path: str | Path = DEFAULT_CACHE_FILE,
+        ttl: int = DEFAULT_CACHE_TTL,
+        max_entries: int = DEFAULT_CACHE_MAX_ENTRIES,
+        max_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+    ) -> None:
+        self.path = Path(path)
+        self.ttl = int(ttl)
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max(1, int(max_bytes))
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            # WAL 允许 CLI 与 web 多进程同时读写同一个缓存文件。
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS query_results ("
+                " keyword TEXT NOT NULL,"
+                " service_type INTEGER NOT NULL,"
+                " enriched INTEGER NOT NULL DEFAULT 0,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " payload TEXT NOT NULL,"
+                " complete INTEGER NOT NULL DEFAULT 0,"
+                " depth INTEGER NOT NULL DEFAULT 0,"
+                " PRIMARY KEY (keyword, service_type))"
+            )
+            # 旧版缓存文件没有 complete/depth 列：补列后旧记录视为不完整，不再命中。
+            columns = {r[1] for r in self._conn.execute("PRAGMA table_info(query_results)").fetchall()}
+            if "complete" not in columns:
+                self._conn.execute("ALTER TABLE query_results ADD COLUMN complete INTEGER NOT NULL DEFAULT 0")
+            if "depth" not in columns:
+                self._conn.execute("ALTER TABLE query_results ADD COLUMN depth INTEGER NOT NULL DEFAULT 0")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_query_results_accessed ON query_results (accessed_at)"
+            )
+
+    @staticmethod
+    def _normalize(keyword: str) -> str:
+        return (keyword or "").strip()
+
+    @staticmethod
+    def _is_complete(result: dict[str, Any]) -> bool:
+        params = result.get("params") or {}
+        records = params.get("list") or []
+        count = len(records) if isinstance(records, list) else 0
+        try:
+            total = int(params.get("total"))
+        except (TypeError, ValueError):
+            total = count
+        return count >= total
+
+    @staticmethod
+    def _usable(
+        row: tuple[Any, ...],
+        now: float,
+        age_limit: int,
+        require_enriched: bool,
+        depth: int | None,
+    ) -> bool:
+        created_at, enriched, complete, cached_depth = row[:4]
+        if now - float(created_at) > age_limit:
+            return False
+        if require_enriched and not enriched:
+            return False
+        return bool(complete) or (depth is not None and int(cached_depth) >= depth)
+
+    def contains(
+        self,
+        keyword: str,
+        service_type: int,
+        max_age: int | None = None,
+        require_enriched: bool = False,
+        depth: int | None = None,
+    ) -> bool:
+        # 与 get() 的命中条件相同，但不读取、不解析结果内容，用于批量预判是否需要建客户端。
+        age_limit = self.ttl if max_age is None else int(max_age)
+        if age_limit <= 0:
+            return False
+        key = (self._normalize(keyword), int(service_type))
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT created_at, enriched, complete, depth FROM query_results"
+                " WHERE keyword = ? AND service_type = ?",
+                key,
+            ).fetchone()
+        return row is not None and self._usable(row, time.time(), age_limit, require_enriched, depth)
+
+    def get(
+        self,
+        keyword: str,
+        service_type: int,
+        max_age: int | None = None,
+        require_enriched: bool = False,
+        depth: int | None = None,
+    ) -> dict[str, Any] | None:
+        # depth：本次查询最多需要的记录条数(max_pages * page_size)，None 表示需要完整结果。
+        age_limit = self.ttl if max_age is None else int(max_age)
+        if age_limit <= 0:
+            return None
+        now = time.time()
+        key = (self._normalize(keyword), int(service_type))
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT created_at, enriched, complete, depth, payload FROM query_results"
+                " WHERE keyword = ? AND service_type = ?",
+                key,
+            ).fetchone()
+            if row is None or not self._usable(row, now, age_limit, require_enriched, depth):
+                return None
+            payload = row[4]
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE query_results SET accessed_at = ? WHERE keyword = ? AND service_type = ?",
+                    (now, *key),
+                )
+        try:
+            return json.loads(payload)
+        except ValueError:
+            return None
+
+    def put(
+        self,
+        keyword: str,
+        service_type: int,
+        result: dict[str, Any],
+        enriched: bool = False,
+        depth: int = 0,
+    ) -> None:
+        payload = json.dumps(result, ensure_ascii=False, separators=(",", ":"))
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO query_results"
+                " (keyword, service_type, enriched, created_at, accessed_at, size, payload, complete, depth)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    self._normalize(keyword),
+                    int(service_type),
+                    1 if enriched else 0,
+                    now,
+                    now,
+                    len(payload.encode("utf-8")),
+                    payload,
+                    1 if self._is_complete(result) else 0,
+                    max(0, int(depth)),
+                ),
+            )
+            self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        # 先清过期，再按最近访问时间(LRU)裁剪到条数/字节上限以内。
+        self._conn.execute("DELETE FROM query_results WHERE created_at < ?", (now - max(0, self.ttl),))
+        count, total_bytes = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM query_results"
+        ).fetchone()
+        if count <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+        rows = self._conn.execute(
+            "SELECT keyword, service_type, size FROM query_results ORDER BY accessed_at ASC"
+        ).fetchall()
+        victims: list[tuple[str, int]] = []
+        for keyword, service_type, size in rows:
+            if count <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            victims.append((keyword, service_type))
+            count -= 1
+            total_bytes -= int(size)
+        self._conn.executemany(
+            "DELETE FROM query_results WHERE keyword = ? AND service_type = ?",
+            victims,
+        )
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM query_results")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int(self._conn.execute("SELECT COUNT(*) FROM query_results").fetchone()[0])
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+DEFAULT_DETAIL_CACHE_MAX_ENTRIES = 20000
+
+
+# queryDetailByAppAndMiniId 结果缓存：内存 LRU 为一级，可选 SQLite 文件为二级，按 TTL 过期。
+class DetailCache:
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_DETAIL_CACHE_MAX_ENTRIES,
+        ttl: int = DEFAULT_CACHE_TTL,
+        path: str | Path | None = None,
+    ) -> None:
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = int(ttl)
+        self._lock = threading.Lock()
+        self._items: OrderedDict[tuple[str, str], tuple[float, dict[str, Any]]] = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._conn: sqlite3.Connection | None = None
+        if path:
+            self._conn = sqlite3.connect(str(path), timeout=30, check_same_thread=False)
+            with self._lock, self._conn:
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS detail_results ("
+                    " service_type TEXT NOT NULL,"
+                    " data_id TEXT NOT NULL,"
+                    " created_at REAL NOT NULL,"
+                    " payload TEXT NOT NULL,"
+                    " PRIMARY KEY (service_type, data_id))"
+                )
+
+    @staticmethod
+    def _key(data_id: Any, service_type: int | None) -> tuple[str, str]:
+        return ("any" if service_type is None else str(service_type), str(data_id))
+
+    def get(self, data_id: Any, service_type: int | None = None) -> dict[str, Any] | None:
+        key = self._key(data_id, service_type)
+        now = time.time()
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                if now - item[0] <= self.ttl:
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    return item[1]
+                self._items.pop(key, None)
+            row = None
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT created_at, payload FROM detail_results WHERE service_type = ? AND data_id = ?",
+                    key,
+                ).fetchone()
+            if row is not None and now - float(row[0]) <= self.ttl:
+                try:
+                    value = json.loads(row[1])
+                except ValueError:
+                    value = None
+                if isinstance(value, dict):
+                    self._remember(key, float(row[0]), value)
+                    self.disk_hits += 1
+                    return value
+            self.misses += 1
+            return None
+
+    def put(self, data_id: Any, service_type: int | None, value: dict[str, Any]) -> None:
+        key = self._key(data_id, service_type)
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO detail_results (service_type, data_id, created_at, payload)"
+                        " VALUES (?, ?, ?, ?)",
+                        (*key, now, json.dumps(value, ensure_ascii=False, separators=(",", ":"))),
+                    )
+                    self._conn.execute("DELETE FROM detail_results WHERE created_at < ?", (now - max(0, self.ttl),))
+
+    def _remember(self, key: tuple[str, str], stored_at: float, value: dict[str, Any]) -> None:
+        self._items[key] = (stored_at, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._items),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
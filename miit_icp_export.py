@@ -0,0 +1,224 @@
+import csv
+import io
+import json
+from typing import Any, Iterable, Iterator
+
+
+CSV_CHUNK_ROWS = 500
+CSV_FIXED_COLUMNS = ("query", "query_type", "ok", "count")
+
+
+def is_domain(text: str) -> bool:
+    t = text.strip().lower()
+    return "." in t and " " not in t
+
+
+def query_type_of(keyword: str) -> str:
+    return "域名" if is_domain(keyword) else "主体"
+
+
+def record_columns(records: Iterable[Any]) -> list[str]:
+    # 一次查询结果中所有记录字段名的并集，按字母排序。
+    columns: set[str] = set()
+    for rec in records:
+        if isinstance(rec, dict):
+            columns.update(rec.keys())
+    return sorted(columns)
+
+
+def export_row_from_cli(row: dict[str, Any]) -> dict[str, Any]:
+    # 命令行结果行 {"query", "ok", "result"/"error"} 转成与 web 相同的导出行结构。
+    query = row.get("query", "")
+    records = ((row.get("result") or {}).get("params") or {}).get("list") or []
+    if not isinstance(records, list):
+        records = []
+    return {
+        "query": query,
+        "query_type": query_type_of(query),
+        "ok": bool(row.get("ok")),
+        "count": len(records),
+        "record_columns": record_columns(records),
+        "records": records,
+        "error": row.get("error", ""),
+    }
+
+
+def collect_record_columns(rows: Iterable[dict[str, Any]]) -> list[str]:
+    # 各行 record_columns 的并集，按首次出现的顺序。
+    columns: list[str] = []
+    seen: set[str] = set()
+    for row in rows:
+        for c in row.get("record_columns") or []:
+            if c not in seen:
+                seen.add(c)
+                columns.append(c)
+    return columns
+
+
+def iter_csv_rows(rows: Iterable[dict[str, Any]], columns: list[str]) -> Iterator[list[Any]]:
+    yield [*CSV_FIXED_COLUMNS, *columns, "error"]
+    for row in rows:
+        query = row.get("query", "")
+        query_type = row.get("query_type", "")
+        ok = row.get("ok", False)
+        count = row.get("count", 0)
+        error = row.get("error", "")
+        records = row.get("records") or []
+
+        if ok and records:
+            for rec in records:
+                values = [rec.get(c, "") if isinstance(rec, dict) else "" for c in columns]
+                yield [query, query_type, ok, count, *values, ""]
+        else:
+            yield [query, query_type, ok, count, *([""] * len(columns)), error]
+
+
+def iter_csv_chunks(
+    rows: Iterable[dict[str, Any]],
+    columns: list[str] | None = None,
+    chunk_rows: int = CSV_CHUNK_ROWS,
+    bom: bool = True,
+) -> Iterator[bytes]:
+    # 每 chunk_rows 行编码输出一次，内存只保留当前块；首块带 BOM，Excel 打开不乱码。
+    # 未给出 columns 时需要先扫一遍求列并集，rows 必须可重复迭代。
+    if columns is None:
+        rows = rows if isinstance(rows, (list, tuple)) else list(rows)
+        columns = collect_record_columns(rows)
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    prefix = "\ufeff" if bom else ""
+    pending = 0
+    for line in iter_csv_rows(rows, columns):
+        writer.writerow(line)
+        pending += 1
+        if pending >= chunk_rows:
+            yield (prefix + buf.getvalue()).encode("utf-8")
+            prefix = ""
+            buf.seek(0)
+            buf.truncate()
+            pending = 0
+    if pending or prefix:
+        yield (prefix + buf.getvalue()).encode("utf-8")
+
+
+def write_csv(path: Any, rows: Iterable[dict[str, Any]], columns: list[str] | None = None) -> None:
+    with open(path, "wb") as fh:
+        for chunk in iter_csv_chunks(rows, columns):
+            fh.write(chunk)
+
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "jsonl": ("application/x-ndjson", "jsonl"),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.file", "arrow"),
+}
+
+
+def iter_jsonl_chunks(rows: Iterable[dict[str, Any]], chunk_rows: int = CSV_CHUNK_ROWS) -> Iterator[bytes]:
+    lines: list[str] = []
+    for row in rows:
+        lines.append(json.dumps(row, ensure_ascii=False))
+        if len(lines) >= chunk_rows:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def build_xlsx(rows: Iterable[dict[str, Any]], columns: list[str] | None = None) -> bytes:
+    # 需要 openpyxl；write_only 模式逐行写入，不在内存里保留单元格对象。
+    from openpyxl import Workbook
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+    if columns is None:
+        rows = rows if isinstance(rows, (list, tuple)) else list(rows)
+        columns = collect_record_columns(rows)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("icp")
+    for line in iter_csv_rows(rows, columns):
+        cells = []
+        for v in line:
+            if isinstance(v, (dict, list)):
+                v = json.dumps(v, ensure_ascii=False)
+            if isinstance(v, str):
+                v = ILLEGAL_CHARACTERS_RE.sub("", v)
+            cells.append(v)
+        ws.append(cells)
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+# 去重值占非空值的比例不超过该阈值的字符串列(unitName、natureName 等)按字典编码存储。
+DICTIONARY_MAX_RATIO = 0.5
+
+
+def _arrow_array(values: list[Any]) -> Any:
+    import pyarrow as pa
+
+    present = [v for v in values if v is not None]
+    if present and all(isinstance(v, bool) for v in present):
+        return pa.array(values, type=pa.bool_())
+    if present and all(isinstance(v, int) and not isinstance(v, bool) for v in present):
+        return pa.array(values, type=pa.int64())
+    if present and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present):
+        return pa.array([None if v is None else float(v) for v in values], type=pa.float64())
+    strings = [
+        None if v is None else json.dumps(v, ensure_ascii=False) if isinstance(v, (dict, list)) else str(v)
+        for v in values
+    ]
+    arr = pa.array(strings, type=pa.string())
+    distinct = len({v for v in strings if v is not None})
+    if present and distinct <= DICTIONARY_MAX_RATIO * len(present):
+        arr = arr.dictionary_encode()
+    return arr
+
+
+def build_arrow_table(rows: Iterable[dict[str, Any]], columns: list[str] | None = None) -> Any:
+    # 需要 pyarrow；每条备案记录一行，列为固定列 + 记录字段并集 + error，缺失值为 null。
+    import pyarrow as pa
+
+    if columns is None:
+        rows = rows if isinstance(rows, (list, tuple)) else list(rows)
+        columns = collect_record_columns(rows)
+    names = [*CSV_FIXED_COLUMNS, *columns, "error"]
+    data: list[list[Any]] = [[] for _ in names]
+    for row in rows:
+        ok = bool(row.get("ok", False))
+        base = (row.get("query", ""), row.get("query_type", ""), ok, int(row.get("count") or 0))
+        records = (row.get("records") or []) if ok else []
+        for rec in records or [None]:
+            rec = rec if isinstance(rec, dict) else {}
+            values = [*base, *(rec.get(c) for c in columns), None if records else (row.get("error") or None)]
+            for col, v in zip(data, values):
+                col.append(v)
+    return pa.Table.from_arrays([_arrow_array(col) for col in data], names=names)
+
+
+def build_parquet(rows: Iterable[dict[str, Any]], columns: list[str] | None = None) -> bytes:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = pa.BufferOutputStream()
+    pq.write_table(build_arrow_table(rows, columns), sink, compression="zstd")
+    return sink.getvalue().to_pybytes()
+
+
+def build_arrow_ipc(rows: Iterable[dict[str, Any]], columns: list[str] | None = None) -> bytes:
+    import pyarrow as pa
+
+    table = build_arrow_table(rows, columns)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+# 二进制格式一次性生成；值为 (生成函数, 所需可选依赖)。
+BINARY_EXPORTS = {
+    "xlsx": (build_xlsx, "openpyxl"),
+    "parquet": (build_parquet, "pyarrow"),
+    "arrow": (build_arrow_ipc, "pyarrow"),
+}
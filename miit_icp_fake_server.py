@@ -0,0 +1,437 @@
+import argparse
+import base64
+import hashlib
+import json
+import random
+import struct
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs
+
+from miit_icp_export import is_domain
+
+
+DEFAULT_FAKE_PORT = 8900
+API_PREFIX = "/icpproject_query/api/"
+CAPTCHA_WIDTH = 490
+CAPTCHA_HEIGHT = 300
+CAPTCHA_PIECE = 60
+CAPTCHA_POOL_SIZE = 8
+APP_SERVICE_TYPES = (6, 7, 8)
+
+
+def _png(width: int, height: int, rows: list[bytes], color_type: int) -> bytes:
+    # 纯标准库 PNG 编码(color_type 0=灰度, 6=RGBA)，模拟服务不依赖 PIL。
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    raw = b"".join(b"\x00" + row for row in rows)
+    header = struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 6)) + chunk(b"IEND", b"")
+
+
+def make_captcha(rng: random.Random) -> tuple[int, str, str]:
+    # 随机纹理背景 + 方形缺口，小图是缺口处的原始纹理；OpenCV 模板匹配可以精确定位 x。
+    x = rng.randint(CAPTCHA_PIECE, CAPTCHA_WIDTH - CAPTCHA_PIECE - 10)
+    y = rng.randint(10, CAPTCHA_HEIGHT - CAPTCHA_PIECE - 10)
+    noise = rng.randbytes(CAPTCHA_WIDTH * CAPTCHA_HEIGHT)
+    big_rows = [bytearray(noise[r * CAPTCHA_WIDTH : (r + 1) * CAPTCHA_WIDTH]) for r in range(CAPTCHA_HEIGHT)]
+    small_rows = []
+    for r in range(y, y + CAPTCHA_PIECE):
+        piece = bytes(big_rows[r][x : x + CAPTCHA_PIECE])
+        small_rows.append(b"".join(bytes((v, v, v, 255)) for v in piece))
+        big_rows[r][x : x + CAPTCHA_PIECE] = bytes(v * 6 // 10 for v in piece)
+    big = _png(CAPTCHA_WIDTH, CAPTCHA_HEIGHT, [bytes(r) for r in big_rows], 0)
+    small = _png(CAPTCHA_PIECE, CAPTCHA_PIECE, small_rows, 6)
+    return x, base64.b64encode(big).decode("ascii"), base64.b64encode(small).decode("ascii")
+
+
+def synthetic_record(keyword: str, service_type: int, i: int, seed: int = 0) -> dict[str, Any]:
+    # 同一 (keyword, service_type, i) 每次生成相同记录，翻页/重跑结果稳定。
+    digest = hashlib.md5(f"{seed}|{keyword}|{service_type}".encode("utf-8")).hexdigest()
+    rng = random.Random(f"{digest}|{i}")
+    main_id = int(digest[:7], 16)
+    licence = f"京ICP备{main_id % 10**8:08d}号"
+    domain_kw = is_domain(keyword)
+    unit = "示例网络科技有限公司" if domain_kw else keyword.strip()
+    rec: dict[str, Any] = {
+        "contentTypeName": rng.choice(["", "新闻", "电子公告", "网络文化"]),
+        "leaderName": "",
+        "limitAccess": rng.choice(["否", "是"]),
+        "mainId": main_id,
+        "mainLicence": licence,
+        "natureName": rng.choice(["企业", "企业", "个人", "事业单位"]),
+        "serviceId": main_id * 1000 + i,
+        "unitName": unit,
+        "updateRecordTime": f"20{rng.randint(15, 24):02d}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} "
+        f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}",
+    }
+    if service_type in APP_SERVICE_TYPES:
+        rec["dataId"] = main_id * 1000 + i
+        rec["serviceName"] = f"{unit}应用{i + 1}"
+        rec["serviceLicence"] = f"{licence}-{i + 1}A"
+        rec["serviceType"] = service_type
+    else:
+        rec["domain"] = keyword.strip().lower() if domain_kw else f"site{i + 1}-{digest[:6]}.example.cn"
+        rec["domainId"] = main_id * 1000 + i
+        rec["serviceLicence"] = f"{licence}-{i + 1}"
+    return rec
+
+
+def synthetic_detail(data_id: int, service_type: int) -> dict[str, Any]:
+    rng = random.Random(f"detail|{data_id}|{service_type}")
+    return {
+        "dataId": data_id,
+        "serviceType": service_type,
+        "mainUnitAddress": f"北京市海淀区示例路{rng.randint(1, 999)}号",
+        "serviceLeaderName": "",
+        "version": f"{rng.randint(1, 9)}.{rng.randint(0, 9)}.{rng.randint(0, 9)}",
+        "appInfo": {"platform": rng.choice(["Android", "iOS", "Android/iOS"])},
+        "subjectInfo": {"unitAddress": "北京市", "natureName": "企业"},
+    }
+
+
+# 模拟服务的行为参数：延迟、每个关键词的记录数、错误注入比例、验证码容差等。
+class FakeMiitConfig:
+    def __init__(
+        self,
+        latency: float = 0.05,
+        jitter: float = 0.0,
+        records: int = 25,
+        max_page_size: int = 100,
+        waf_rate: float = 0.0,
+        error_rate: float = 0.0,
+        expire_rate: float = 0.0,
+        captcha_fail_rate: float = 0.0,
+        captcha_tolerance: int = 5,
+        detail_key: str = "dataId",
+        seed: int = 0,
+    ) -> None:
+        self.latency = max(0.0, latency)
+        self.jitter = max(0.0, jitter)
+        self.records = max(0, records)
+        self.max_page_size = max(1, max_page_size)
+        self.waf_rate = waf_rate
+        self.error_rate = error_rate
+        self.expire_rate = expire_rate
+        self.captcha_fail_rate = captcha_fail_rate
+        self.captcha_tolerance = captcha_tolerance
+        self.detail_key = detail_key
+        self.seed = seed
+
+
+class FakeMiitState:
+    def __init__(self, config: FakeMiitConfig) -> None:
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.captchas = [make_captcha(self.rng) for _ in range(CAPTCHA_POOL_SIZE)]
+        self._lock = threading.Lock()
+        self.tokens: set[str] = set()
+        self.pending: dict[str, int] = {}
+        self.signs: dict[str, str] = {}
+        self.stats: dict[str, int] = {}
+
+    def count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def roll(self, rate: float) -> bool:
+        if rate <= 0:
+            return False
+        with self._lock:
+            return self.rng.random() < rate
+
+    def delay(self) -> None:
+        latency = self.config.latency
+        if self.config.jitter:
+            with self._lock:
+                latency += self.rng.uniform(0, self.config.jitter)
+        if latency:
+            time.sleep(latency)
+
+    def new_captcha(self) -> tuple[str, str, str]:
+        with self._lock:
+            x, big, small = self.rng.choice(self.captchas)
+            key = uuid.uuid4().hex
+            self.pending[key] = x
+        return key, big, small
+
+    def check_captcha(self, key: str, value: Any) -> str:
+        with self._lock:
+            x = self.pending.pop(key, None)
+        if x is None:
+            return ""
+        try:
+            offset = int(float(value))
+        except (TypeError, ValueError):
+            return ""
+        tolerance = self.config.captcha_tolerance
+        if tolerance >= 0 and abs(offset - x) > tolerance:
+            return ""
+        if self.roll(self.config.captcha_fail_rate):
+            return ""
+        sign = uuid.uuid4().hex
+        with self._lock:
+            self.signs[key] = sign
+        return sign
+
+    def credentials_ok(self, token: str, key: str, sign: str) -> bool:
+        with self._lock:
+            return token in self.tokens and bool(sign) and self.signs.get(key) == sign
+
+
+def _ok(params: Any) -> dict[str, Any]:
+    return {"code": 200, "msg": "操作成功", "params": params, "success": True}
+
+
+def _fail(code: int, msg: str) -> dict[str, Any]:
+    return {"code": code, "msg": msg, "success": False}
+
+
+class FakeMiitHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeMiit/1.0"
+    state: FakeMiitState
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send(self, status: int, body: Any, headers: dict[str, str] | None = None) -> None:
+        if isinstance(body, (dict, list)):
+            raw = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            content_type = "application/json;charset=UTF-8"
+        else:
+            raw = str(body).encode("utf-8")
+            content_type = "text/html;charset=UTF-8"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(raw)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _body(self) -> dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        if "json" in (self.headers.get("Content-Type") or ""):
+            try:
+                data = json.loads(raw or b"{}")
+            except ValueError:
+                return {}
+            return data if isinstance(data, dict) else {}
+        return {k: v[0] for k, v in parse_qs(raw.decode("utf-8")).items()}
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/") == "/__stats":
+            with self.state._lock:
+                self._send(200, dict(self.state.stats))
+            return
+        self._send(404, _fail(404, "not found"))
+
+    def do_POST(self) -> None:
+        state = self.state
+        body = self._body()
+        path = self.path.split("?", 1)[0]
+        endpoint = path[len(API_PREFIX) :] if path.startswith(API_PREFIX) else path.lstrip("/")
+        handler = {
+            "auth": self._auth,
+            "image/getCheckImagePoint": self._check_images,
+            "image/checkImage": self._check_image,
+            "icpAbbreviateInfo/queryByCondition": self._query,
+            "icpAbbreviateInfo/queryDetailByAppAndMiniId": self._detail,
+        }.get(endpoint)
+        if handler is None:
+            self._send(404, _fail(404, "not found"))
+            return
+        state.count(endpoint)
+        state.delay()
+        handler(body)
+
+    def _inject_errors(self, endpoint: str) -> bool:
+        # 只对业务接口注入错误：WAF 403、业务失败(code!=200)、凭据过期(code=401)。
+        state = self.state
+        if state.roll(state.config.waf_rate):
+            state.count(f"{endpoint}:waf_403")
+            self._send(
+                403,
+                "<html><body><script>document.cookie='__jsl_clearance=0';location.reload();</script></body></html>",
+                {"X-Via-JSL": "fake,blocked"},
+            )
+            return True
+        if state.roll(state.config.error_rate):
+            state.count(f"{endpoint}:business")
+            self._send(200, _fail(500, "系统繁忙，请稍后再试"))
+            return True
+        if state.roll(state.config.expire_rate):
+            state.count(f"{endpoint}:expired")
+            self._send(200, _fail(401, "token过期，请重新获取"))
+            return True
+        return False
+
+    def _auth(self, body: dict[str, Any]) -> None:
+        if not body.get("authKey") or not body.get("timeStamp"):
+            self._send(200, _fail(500, "authKey/timeStamp 不能为空"))
+            return
+        token = uuid.uuid4().hex
+        with self.state._lock:
+            self.state.tokens.add(token)
+        self._send(200, _ok({"bussiness": token, "expire": 300000, "refresh": uuid.uuid4().hex, "token": token}))
+
+    def _check_images(self, body: dict[str, Any]) -> None:
+        token = self.headers.get("token") or ""
+        with self.state._lock:
+            known = token in self.state.tokens
+        if not known:
+            self._send(200, _fail(401, "token过期，请重新获取"))
+            return
+        key, big, small = self.state.new_captcha()
+        params = {"bigImage": big, "smallImage": small, "secretKey": uuid.uuid4().hex[:16], "uuid": key, "wordCount": 1}
+        self._send(200, _ok(params))
+
+    def _check_image(self, body: dict[str, Any]) -> None:
+        sign = self.state.check_captcha(str(body.get("key") or ""), body.get("value"))
+        if not sign:
+            self.state.count("image/checkImage:failed")
+            self._send(200, _fail(500, "验证失败"))
+            return
+        self._send(200, _ok({"sign": sign}))
+
+    def _authorized(self) -> bool:
+        h = self.headers
+        if self.state.credentials_ok(h.get("token") or "", h.get("uuid") or "", h.get("sign") or ""):
+            return True
+        self._send(200, _fail(401, "token或sign失效，请重新验证"))
+        return False
+
+    def _query(self, body: dict[str, Any]) -> None:
+        if not self._authorized() or self._inject_errors("queryByCondition"):
+            return
+        config = self.state.config
+        keyword = str(body.get("unitName") or "").strip()
+        service_type = int(body.get("serviceType") or 1)
+        page_num = max(1, int(body.get("pageNum") or 1))
+        page_size = min(config.max_page_size, max(1, int(body.get("pageSize") or 10)))
+        total = 0 if not keyword else 1 if is_domain(keyword) else config.records
+        pages = max(1, (total + page_size - 1) // page_size)
+        start = (page_num - 1) * page_size
+        end = min(total, start + page_size)
+        records = [synthetic_record(keyword, service_type, i, config.seed) for i in range(start, end)]
+        params = {
+            "endRow": max(0, end - 1),
+            "firstPage": 1,
+            "hasNextPage": page_num < pages,
+            "hasPreviousPage": page_num > 1,
+            "isFirstPage": page_num == 1,
+            "isLastPage": page_num >= pages,
+            "lastPage": pages,
+            "list": records,
+            "navigatePages": 8,
+            "navigatepageNums": list(range(max(1, page_num - 3), min(pages, page_num + 4) + 1)),
+            "nextPage": page_num + 1 if page_num < pages else 0,
+            "pageNum": page_num,
+            "pageSize": page_size,
+            "pages": pages,
+            "prePage": page_num - 1,
+            "size": len(records),
+            "startRow": start,
+            "total": total,
+        }
+        self._send(200, _ok(params), {"rci": uuid.uuid4().hex})
+
+    def _detail(self, body: dict[str, Any]) -> None:
+        if not self._authorized() or self._inject_errors("queryDetailByAppAndMiniId"):
+            return
+        data_id = body.get(self.state.config.detail_key)
+        if data_id in (None, ""):
+            self._send(200, _fail(500, f"{self.state.config.detail_key} 不能为空"))
+            return
+        try:
+            data_id = int(data_id)
+            service_type = int(body.get("serviceType") or 6)
+        except (TypeError, ValueError):
+            self._send(200, _fail(500, f"{self.state.config.detail_key}/serviceType 格式错误"))
+            return
+        self._send(200, _ok(synthetic_detail(data_id, service_type)))
+
+
+# 本地模拟工信部查询接口，供离线端到端压测；可命令行启动，也可在脚本/基准里后台启动。
+class FakeMiitServer:
+    def __init__(self, config: FakeMiitConfig | None = None, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.state = FakeMiitState(config or FakeMiitConfig())
+        handler = type("BoundFakeMiitHandler", (FakeMiitHandler,), {"state": self.state})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}{API_PREFIX}"
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake-miit", daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def __enter__(self) -> "FakeMiitServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="本地模拟工信部 ICP 查询接口(离线压测用)")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=DEFAULT_FAKE_PORT, help="监听端口")
+    parser.add_argument("--latency", type=float, default=0.05, help="每个请求的固定延迟(秒)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="在固定延迟上叠加的 0~jitter 秒随机延迟")
+    parser.add_argument("--records", type=int, default=25, help="每个主体关键词返回的记录数(域名关键词固定 1 条)")
+    parser.add_argument("--max-page-size", type=int, default=100, help="单页最多返回条数")
+    parser.add_argument("--waf-rate", type=float, default=0.0, help="查询/详情接口返回 403 + X-Via-JSL 的比例")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="查询/详情接口返回业务失败(code=500)的比例")
+    parser.add_argument("--expire-rate", type=float, default=0.0, help="查询/详情接口返回凭据过期(code=401)的比例")
+    parser.add_argument("--captcha-fail-rate", type=float, default=0.0, help="滑块位置正确时仍判定失败的比例")
+    parser.add_argument("--captcha-tolerance", type=int, default=5, help="滑块偏移允许误差(像素)，-1 表示任意偏移都通过")
+    parser.add_argument("--detail-key", default="dataId", help="详情接口接受的 id 参数名")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子，相同种子生成相同的验证码与记录")
+    args = parser.parse_args()
+
+    config = FakeMiitConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        records=args.records,
+        max_page_size=args.max_page_size,
+        waf_rate=args.waf_rate,
+        error_rate=args.error_rate,
+        expire_rate=args.expire_rate,
+        captcha_fail_rate=args.captcha_fail_rate,
+        captcha_tolerance=args.captcha_tolerance,
+        detail_key=args.detail_key,
+        seed=args.seed,
+    )
+    server = FakeMiitServer(config, host=args.host, port=args.port)
+    print(f"[+] fake MIIT API: {server.base_url}")
+    print(f"[+] 使用: ICP_BASE_URL={server.base_url} 或 --base-url {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+
+DEFAULT_INDEX_FILE = "icp_index.sqlite3"
+DEFAULT_SEARCH_LIMIT = 50
+SEARCH_MODES = ("auto", "exact", "prefix", "substring")
+
+# 建索引的字段：(记录字段名, 表列名)
+INDEX_FIELDS = (
+    ("domain", "domain"),
+    ("unitName", "unit_name"),
+    ("mainLicence", "main_licence"),
+    ("serviceLicence", "service_licence"),
+)
+_COLUMNS = tuple(col for _, col in INDEX_FIELDS)
+# trigram 分词至少需要 3 个字符，更短的子串查询退回 LIKE 扫表。
+_TRIGRAM_MIN_CHARS = 3
+
+
+# 本地备案记录索引：把 query_company_all 的结果按记录拆开落到 SQLite，
+# 精确/前缀查询走 B 树索引，子串查询走 FTS5 trigram 全文索引，离线毫秒级返回。
+class RecordIndex:
+    def __init__(self, path: str | Path = DEFAULT_INDEX_FILE) -> None:
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS records ("
+                " id INTEGER PRIMARY KEY,"
+                " service_type INTEGER NOT NULL,"
+                " domain TEXT NOT NULL DEFAULT '',"
+                " unit_name TEXT NOT NULL DEFAULT '',"
+                " main_licence TEXT NOT NULL DEFAULT '',"
+                " service_licence TEXT NOT NULL DEFAULT '',"
+                " keyword TEXT NOT NULL,"
+                " updated_at REAL NOT NULL,"
+                " payload TEXT NOT NULL,"
+                " UNIQUE (service_type, domain, unit_name, main_licence, service_licence))"
+            )
+            for col in _COLUMNS:
+                self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_records_{col} ON records ({col})")
+            self.fts = self._create_fts()
+
+    def _create_fts(self) -> bool:
+        # 旧版 SQLite 不支持 trigram 分词时仍可使用，只是子串查询变成 LIKE 扫表。
+        cols = ", ".join(_COLUMNS)
+        new_cols = ", ".join(f"new.{c}" for c in _COLUMNS)
+        old_cols = ", ".join(f"old.{c}" for c in _COLUMNS)
+        try:
+            self._conn.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5("
+                f"{cols}, content='records', content_rowid='id', tokenize='trigram')"
+            )
+        except sqlite3.OperationalError:
+            return False
+        self._conn.execute(
+            f"CREATE TRIGGER IF NOT EXISTS records_ai AFTER INSERT ON records BEGIN"
+            f" INSERT INTO records_fts (rowid, {cols}) VALUES (new.id, {new_cols}); END"
+        )
+        self._conn.execute(
+            f"CREATE TRIGGER IF NOT EXISTS records_ad AFTER DELETE ON records BEGIN"
+            f" INSERT INTO records_fts (records_fts, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); END"
+        )
+        self._conn.execute(
+            f"CREATE TRIGGER IF NOT EXISTS records_au AFTER UPDATE ON records BEGIN"
+            f" INSERT INTO records_fts (records_fts, rowid, {cols}) VALUES ('delete', old.id, {old_cols});"
+            f" INSERT INTO records_fts (rowid, {cols}) VALUES (new.id, {new_cols}); END"
+        )
+        return True
+
+    @staticmethod
+    def _field(rec: dict[str, Any], key: str) -> str:
+        value = str(rec.get(key) or "").strip()
+        return value.lower() if key == "domain" else value
+
+    def add_result(self, keyword: str, service_type: int, raw: dict[str, Any]) -> int:
+        records = (raw.get("params") or {}).get("list") or []
+        rows = []
+        now = time.time()
+        for rec in records if isinstance(records, list) else []:
+            if not isinstance(rec, dict):
+                continue
+            values = [self._field(rec, key) for key, _ in INDEX_FIELDS]
+            if not any(values):
+                continue
+            rows.append(
+                (int(service_type), *values, (keyword or "").strip(), now, json.dumps(rec, ensure_ascii=False))
+            )
+        if not rows:
+            return 0
+        cols = ", ".join(_COLUMNS)
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT INTO records (service_type, {cols}, keyword, updated_at, payload)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+                f" ON CONFLICT (service_type, {cols}) DO UPDATE SET"
+                " keyword = excluded.keyword, updated_at = excluded.updated_at, payload = excluded.payload",
+                rows,
+            )
+        return len(rows)
+
+    def import_result_cache(self, cache_path: str | Path) -> int:
+        # 从 ResultCache 的 SQLite 文件回填历史查询结果。
+        src = sqlite3.connect(f"file:{Path(cache_path)}?mode=ro", uri=True)
+        try:
+            rows = src.execute("SELECT keyword, service_type, payload FROM query_results").fetchall()
+        finally:
+            src.close()
+        total = 0
+        for keyword, service_type, payload in rows:
+            try:
+                raw = json.loads(payload)
+            except ValueError:
+                continue
+            if isinstance(raw, dict):
+                total += self.add_result(keyword, service_type, raw)
+        return total
+
+    def _select(self, where: str, params: list[Any], service_type: int | None, limit: int) -> list[dict[str, Any]]:
+        sql = f"SELECT payload FROM records WHERE ({where})"
+        if service_type is not None:
+            sql += " AND service_type = ?"
+            params = [*params, int(service_type)]
+        sql += " ORDER BY updated_at DESC LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(sql, [*params, max(1, limit)]).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def _search_exact(self, term: str, service_type: int | None, limit: int) -> list[dict[str, Any]]:
+        where = " OR ".join(f"{col} = ?" for col in _COLUMNS)
+        params = [term.lower() if col == "domain" else term for col in _COLUMNS]
+        return self._select(where, params, service_type, limit)
+
+    def _search_prefix(self, term: str, service_type: int | None, limit: int) -> list[dict[str, Any]]:
+        # 用区间比较代替 LIKE 'x%'，可以走各列的 B 树索引。
+        where = " OR ".join(f"({col} >= ? AND {col} < ?)" for col in _COLUMNS)
+        params: list[Any] = []
+        for col in _COLUMNS:
+            value = term.lower() if col == "domain" else term
+            params += [value, value + "\U0010ffff"]
+        return self._select(where, params, service_type, limit)
+
+    def _search_substring(self, term: str, service_type: int | None, limit: int) -> list[dict[str, Any]]:
+        if self.fts and len(term) >= _TRIGRAM_MIN_CHARS:
+            where = "id IN (SELECT rowid FROM records_fts WHERE records_fts MATCH ?)"
+            return self._select(where, ['"' + term.replace('"', '""') + '"'], service_type, limit)
+        escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        where = " OR ".join(f"{col} LIKE ? ESCAPE '\\'" for col in _COLUMNS)
+        return self._select(where, [f"%{escaped}%"] * len(_COLUMNS), service_type, limit)
+
+    def search(
+        self,
+        term: str,
+        mode: str = "auto",
+        service_type: int | None = None,
+        limit: int = DEFAULT_SEARCH_LIMIT,
+    ) -> tuple[str, list[dict[str, Any]]]:
+        # auto 依次尝试精确、前缀、子串，返回第一个有结果的方式。
+        term = (term or "").strip()
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"unknown search mode: {mode}")
+        if not term:
+            return mode, []
+        modes = ("exact", "prefix", "substring") if mode == "auto" else (mode,)
+        records: list[dict[str, Any]] = []
+        for current in modes:
+            records = getattr(self, f"_search_{current}")(term, service_type, limit)
+            if records:
+                return current, records
+        return modes[-1], records
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int(self._conn.execute("SELECT COUNT(*) FROM records").fetchone()[0])
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,324 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+
+DEFAULT_JOB_DB_FILE = "icp_jobs.sqlite3"
+DEFAULT_JOB_WORKERS = 2
+DEFAULT_JOB_MAX_PENDING = 20
+DEFAULT_JOB_RETENTION = 7 * 24 * 3600
+# 运行中的任务超过这么久没有心跳，视为所属 worker 已退出，可由其它 worker 接手。
+# 执行中的 worker 每 stale_after / 4 秒刷新一次心跳，与单个关键词要翻多少页无关。
+DEFAULT_JOB_STALE_AFTER = 10 * 60
+
+JOB_ACTIVE_STATUSES = ("queued", "running")
+
+# runner(params, [(idx, keyword), ...]) -> 逐个 yield (idx, row)
+JobRunner = Callable[[dict[str, Any], list[tuple[int, str]]], Iterator[tuple[int, dict[str, Any]]]]
+
+
+class JobQueueFull(RuntimeError):
+    pass
+
+
+# runner 抛出该异常表示任务需暂停(如被风控拦截)：已完成的结果保留，未完成的关键词等待 resume 后续跑。
+class JobPaused(RuntimeError):
+    pass
+
+
+# 批量任务状态与逐条结果落盘到 SQLite，进程重启后可继续未完成的任务。
+class JobStore:
+    def __init__(self, path: str | Path = DEFAULT_JOB_DB_FILE) -> None:
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " job_id TEXT PRIMARY KEY,"
+                " status TEXT NOT NULL,"
+                " params TEXT NOT NULL,"
+                " keywords TEXT NOT NULL,"
+                " total INTEGER NOT NULL,"
+                " done INTEGER NOT NULL DEFAULT 0,"
+                " ok INTEGER NOT NULL DEFAULT 0,"
+                " failed INTEGER NOT NULL DEFAULT 0,"
+                " error TEXT NOT NULL DEFAULT '',"
+                " created_at REAL NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_results ("
+                " job_id TEXT NOT NULL,"
+                " idx INTEGER NOT NULL,"
+                " ok INTEGER NOT NULL,"
+                " row TEXT NOT NULL,"
+                " PRIMARY KEY (job_id, idx))"
+            )
+            columns = {r[1] for r in self._conn.execute("PRAGMA table_info(jobs)").fetchall()}
+            if "cancel_requested" not in columns:
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN cancel_requested INTEGER NOT NULL DEFAULT 0")
+
+    def create(self, params: dict[str, Any], keywords: list[str]) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, status, params, keywords, total, created_at, updated_at)"
+                " VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                (
+                    job_id,
+                    json.dumps(params, ensure_ascii=False),
+                    json.dumps(keywords, ensure_ascii=False),
+                    len(keywords),
+                    now,
+                    now,
+                ),
+            )
+        return job_id
+
+    def get(self, job_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT job_id, status, total, done, ok, failed, error, created_at, updated_at"
+                " FROM jobs WHERE job_id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("job_id", "status", "total", "done", "ok", "failed", "error", "created_at", "updated_at")
+        return dict(zip(keys, row))
+
+    def load_spec(self, job_id: str) -> tuple[dict[str, Any], list[str]]:
+        with self._lock:
+            row = self._conn.execute("SELECT params, keywords FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            raise KeyError(job_id)
+        return json.loads(row[0]), json.loads(row[1])
+
+    def done_indexes(self, job_id: str) -> set[int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT idx FROM job_results WHERE job_id = ?", (job_id,)).fetchall()
+        return {int(r[0]) for r in rows}
+
+    def set_status(self, job_id: str, status: str, error: str = "") -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE job_id = ?",
+                (status, error, time.time(), job_id),
+            )
+
+    def claim(self, job_id: str) -> bool:
+        # 多个 worker 共用同一个库时，只有把 queued 改成 running 成功的那个执行任务。
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = 'running', updated_at = ? WHERE job_id = ? AND status = 'queued'",
+                (time.time(), job_id),
+            )
+        return cur.rowcount == 1
+
+    def touch(self, job_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET updated_at = ? WHERE job_id = ? AND status = 'running'",
+                (time.time(), job_id),
+            )
+
+    def resume(self, job_id: str) -> bool:
+        # 暂停/失败的任务重新排队，已有结果的关键词会被跳过。
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', error = '', cancel_requested = 0, updated_at = ?"
+                " WHERE job_id = ? AND status IN ('paused', 'failed')",
+                (time.time(), job_id),
+            )
+        return cur.rowcount == 1
+
+    def requeue_stale(self, job_id: str, stale_after: float) -> bool:
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', updated_at = ?"
+                " WHERE job_id = ? AND status = 'running' AND updated_at < ?",
+                (time.time(), job_id, time.time() - stale_after),
+            )
+        return cur.rowcount == 1
+
+    def request_cancel(self, job_id: str) -> bool:
+        # 取消请求写库，正在执行该任务的 worker(可能是别的进程)逐条检查。
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE job_id = ? AND status IN (?, ?)",
+                (job_id, *JOB_ACTIVE_STATUSES),
+            )
+            if cur.rowcount:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'cancelled', updated_at = ? WHERE job_id = ? AND status = 'queued'",
+                    (time.time(), job_id),
+                )
+        return cur.rowcount == 1
+
+    def cancel_requested(self, job_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def add_result(self, job_id: str, idx: int, row: dict[str, Any]) -> None:
+        ok = 1 if row.get("ok") else 0
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO job_results (job_id, idx, ok, row) VALUES (?, ?, ?, ?)",
+                (job_id, idx, ok, json.dumps(row, ensure_ascii=False)),
+            )
+            if cur.rowcount:
+                self._conn.execute(
+                    "UPDATE jobs SET done = done + 1, ok = ok + ?, failed = failed + ?, updated_at = ?"
+                    " WHERE job_id = ?",
+                    (ok, 1 - ok, time.time(), job_id),
+                )
+
+    def iter_results(self, job_id: str, offset: int = 0, limit: int | None = None) -> Iterator[dict[str, Any]]:
+        sql = "SELECT row FROM job_results WHERE job_id = ? ORDER BY idx LIMIT ? OFFSET ?"
+        with self._lock:
+            rows = self._conn.execute(sql, (job_id, -1 if limit is None else int(limit), max(0, offset))).fetchall()
+        for (row,) in rows:
+            yield json.loads(row)
+
+    def active_job_ids(self) -> list[tuple[str, str]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id, status FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+                JOB_ACTIVE_STATUSES,
+            ).fetchall()
+        return [(r[0], r[1]) for r in rows]
+
+    def purge(self, older_than: float) -> None:
+        cutoff = time.time() - older_than
+        with self._lock, self._conn:
+            expired = [
+                r[0]
+                for r in self._conn.execute(
+                    "SELECT job_id FROM jobs WHERE updated_at < ? AND status NOT IN (?, ?)",
+                    (cutoff, *JOB_ACTIVE_STATUSES),
+                ).fetchall()
+            ]
+            self._conn.executemany("DELETE FROM job_results WHERE job_id = ?", [(j,) for j in expired])
+            self._conn.executemany("DELETE FROM jobs WHERE job_id = ?", [(j,) for j in expired])
+
+
+# 固定大小线程池执行任务；排队数有上限，超出时拒绝提交。
+class JobManager:
+    def __init__(
+        self,
+        store: JobStore,
+        runner: JobRunner,
+        workers: int = DEFAULT_JOB_WORKERS,
+        max_pending: int = DEFAULT_JOB_MAX_PENDING,
+        retention: int = DEFAULT_JOB_RETENTION,
+        stale_after: int = DEFAULT_JOB_STALE_AFTER,
+    ) -> None:
+        self.store = store
+        self.runner = runner
+        self.max_pending = max(1, max_pending)
+        self.retention = retention
+        self.stale_after = stale_after
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="icp-job")
+        self._lock = threading.Lock()
+        self._cancel_events: dict[str, threading.Event] = {}
+        self._stopping = threading.Event()
+
+    def _enqueue(self, job_id: str) -> None:
+        with self._lock:
+            self._cancel_events[job_id] = threading.Event()
+        self._executor.submit(self._run, job_id)
+
+    def submit(self, params: dict[str, Any], keywords: list[str]) -> str:
+        with self._lock:
+            if len(self._cancel_events) >= self.max_pending:
+                raise JobQueueFull(f"排队任务已达上限 {self.max_pending}")
+        self.store.purge(self.retention)
+        job_id = self.store.create(params, keywords)
+        self._enqueue(job_id)
+        return job_id
+
+    def recover(self) -> None:
+        # 排队中的任务和长时间无进度的运行中任务重新入队，已完成的关键词会被跳过。
+        # 其它 worker 正在跑的任务仍在持续更新进度，不会被抢走；同一任务多个 worker 入队时靠 claim() 去重。
+        for job_id, status in self.store.active_job_ids():
+            if status == "running" and not self.store.requeue_stale(job_id, self.stale_after):
+                continue
+            with self._lock:
+                if job_id in self._cancel_events:
+                    continue
+            self._enqueue(job_id)
+
+    def resume(self, job_id: str) -> bool:
+        with self._lock:
+            if len(self._cancel_events) >= self.max_pending:
+                raise JobQueueFull(f"排队任务已达上限 {self.max_pending}")
+        if not self.store.resume(job_id):
+            return False
+        self._enqueue(job_id)
+        return True
+
+    def _heartbeat(self, job_id: str, stop: threading.Event) -> None:
+        while not stop.wait(max(1.0, self.stale_after / 4)):
+            self.store.touch(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        with self._lock:
+            event = self._cancel_events.get(job_id)
+        if event is not None:
+            event.set()
+        return self.store.request_cancel(job_id)
+
+    def _run(self, job_id: str) -> None:
+        with self._lock:
+            cancel_event = self._cancel_events.get(job_id) or threading.Event()
+        heartbeat_stop = threading.Event()
+        try:
+            if cancel_event.is_set() or not self.store.claim(job_id):
+                return
+            heartbeat = threading.Thread(target=self._heartbeat, args=(job_id, heartbeat_stop), daemon=True)
+            heartbeat.start()
+            params, keywords = self.store.load_spec(job_id)
+            done = self.store.done_indexes(job_id)
+            pending = [(idx, kw) for idx, kw in enumerate(keywords) if idx not in done]
+            rows = self.runner(params, pending)
+            try:
+                for idx, row in rows:
+                    self.store.add_result(job_id, idx, row)
+                    if self.store.cancel_requested(job_id):
+                        cancel_event.set()
+                    if cancel_event.is_set() or self._stopping.is_set():
+                        break
+            finally:
+                close = getattr(rows, "close", None)
+                if close is not None:
+                    close()
+            if cancel_event.is_set():
+                self.store.set_status(job_id, "cancelled")
+            elif self._stopping.is_set():
+                # 服务退出时中断的任务保持排队状态，下次启动由 recover() 接着跑。
+                self.store.set_status(job_id, "queued")
+            elif len(self.store.done_indexes(job_id)) < len(keywords):
+                self.store.set_status(job_id, "paused", error="部分关键词未完成，可调用 resume 续跑")
+            else:
+                self.store.set_status(job_id, "done")
+        except JobPaused as exc:
+            self.store.set_status(job_id, "paused", error=str(exc))
+        except Exception as exc:
+            self.store.set_status(job_id, "failed", error=str(exc))
+        finally:
+            heartbeat_stop.set()
+            with self._lock:
+                self._cancel_events.pop(job_id, None)
+
+    def shutdown(self) -> None:
+        self._stopping.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
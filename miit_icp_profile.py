@@ -0,0 +1,130 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any, Iterator
+
+
+WATERFALL_WIDTH = 40
+WATERFALL_MAX_LINES = 200
+
+
+# 记录命令行各阶段的时间片(span)，结束时输出瀑布图/汇总，或导出 Chrome trace(chrome://tracing、Perfetto 可打开)。
+class Profiler:
+    def __init__(self) -> None:
+        self.origin = time.perf_counter()
+        self.spans: list[dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def span(self, name: str, **args: Any) -> Iterator[None]:
+        depth = getattr(self._local, "depth", 0)
+        self._local.depth = depth + 1
+        start = time.perf_counter()
+        error = ""
+        try:
+            yield
+        except BaseException as exc:
+            error = type(exc).__name__
+            raise
+        finally:
+            end = time.perf_counter()
+            self._local.depth = depth
+            item = {
+                "name": name,
+                "start": start - self.origin,
+                "duration": end - start,
+                "depth": depth,
+                "tid": threading.get_ident(),
+                "args": {k: v for k, v in args.items() if v is not None},
+            }
+            if error:
+                item["error"] = error
+            with self._lock:
+                self.spans.append(item)
+
+    def _ordered(self) -> list[dict[str, Any]]:
+        with self._lock:
+            return sorted(self.spans, key=lambda s: (s["start"], s["depth"]))
+
+    def waterfall(self, width: int = WATERFALL_WIDTH, max_lines: int = WATERFALL_MAX_LINES) -> str:
+        spans = self._ordered()
+        if not spans:
+            return "(no spans)"
+        total = max(s["start"] + s["duration"] for s in spans) or 1e-9
+        lines = [f"{'start ms':>10} {'dur ms':>10}  {'timeline':<{width}}  span"]
+        for s in spans[:max_lines]:
+            left = int(s["start"] / total * width)
+            bar = max(1, int(round(s["duration"] / total * width)))
+            bar = min(bar, width - left) if left < width else 1
+            label = "  " * s["depth"] + s["name"]
+            if s["args"]:
+                label += " " + " ".join(f"{k}={v}" for k, v in s["args"].items())
+            if s.get("error"):
+                label += f" !{s['error']}"
+            timeline = (" " * left + "#" * bar).ljust(width)[:width]
+            lines.append(f"{s['start'] * 1000:>10.1f} {s['duration'] * 1000:>10.1f}  {timeline}  {label}")
+        if len(spans) > max_lines:
+            lines.append(f"... 另有 {len(spans) - max_lines} 个 span 未显示，见下方汇总或导出 trace")
+        return "\n".join(lines)
+
+    def totals(self) -> str:
+        # 按 span 名汇总：次数、总耗时、平均、最大。
+        agg: dict[str, list[float]] = {}
+        for s in self._ordered():
+            agg.setdefault(s["name"], []).append(s["duration"])
+        lines = [f"{'span':<20} {'count':>6} {'total ms':>10} {'mean ms':>9} {'max ms':>9}"]
+        for name, durations in sorted(agg.items(), key=lambda kv: -sum(kv[1])):
+            lines.append(
+                f"{name:<20} {len(durations):>6} {sum(durations) * 1000:>10.1f}"
+                f" {sum(durations) / len(durations) * 1000:>9.1f} {max(durations) * 1000:>9.1f}"
+            )
+        return "\n".join(lines)
+
+    def chrome_trace(self) -> dict[str, Any]:
+        pid = os.getpid()
+        events = []
+        for s in self._ordered():
+            args = dict(s["args"])
+            if s.get("error"):
+                args["error"] = s["error"]
+            events.append(
+                {
+                    "name": s["name"],
+                    "ph": "X",
+                    "ts": round(s["start"] * 1e6, 3),
+                    "dur": round(s["duration"] * 1e6, 3),
+                    "pid": pid,
+                    "tid": s["tid"],
+                    "args": args,
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path: str | Path) -> None:
+        Path(path).write_text(json.dumps(self.chrome_trace(), ensure_ascii=False), encoding="utf-8")
+
+
+_ACTIVE: Profiler | None = None
+
+
+def start_profiling() -> Profiler:
+    global _ACTIVE
+    _ACTIVE = Profiler()
+    return _ACTIVE
+
+
+def stop_profiling() -> None:
+    global _ACTIVE
+    _ACTIVE = None
+
+
+def span(name: str, **args: Any) -> Any:
+    # 未开启 --profile 时为空操作，开销只有一次全局变量判断。
+    profiler = _ACTIVE
+    if profiler is None:
+        return nullcontext()
+    return profiler.span(name, **args)
@@ -0,0 +1,177 @@
+import gzip
+import inspect
+import json
+import threading
+import weakref
+from pathlib import Path
+from typing import Any
+from urllib.parse import urlsplit
+
+
+# 只保存客户端会读取的响应头，夹具文件保持紧凑。
+RECORDED_HEADERS = ("content-type", "rci", "x-via-jsl")
+# 这些接口的请求体含时间戳/随机 uuid，只按接口名匹配，按录制顺序依次回放。
+_ORDERED_ENDPOINTS = ("auth", "image/getCheckImagePoint", "image/checkImage")
+
+
+class ReplayMissError(RuntimeError):
+    pass
+
+
+def _endpoint(url: str) -> str:
+    path = urlsplit(url).path
+    marker = "/api/"
+    return path.split(marker, 1)[1] if marker in path else path.lstrip("/")
+
+
+def request_key(url: str, json_body: Any = None, data: Any = None) -> str:
+    # 与 base_url 无关：对线上地址录制的夹具，也可以在任意地址(含本地模拟服务)下回放。
+    endpoint = _endpoint(url)
+    if endpoint in _ORDERED_ENDPOINTS:
+        return endpoint
+    body = json_body if json_body is not None else data
+    return endpoint + " " + json.dumps(body, ensure_ascii=False, sort_keys=True, default=str)
+
+
+def _open(path: Path, mode: str) -> Any:
+    if path.suffix == ".gz":
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class ReplayHeaders(dict):
+    # 大小写不敏感，兼容 requests/curl_cffi 响应头的 `in` / get 用法。
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, str) and dict.__contains__(self, key.lower())
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return dict.get(self, key.lower(), default)
+
+
+class ReplayHTTPError(RuntimeError):
+    def __init__(self, message: str, response: "ReplayResponse") -> None:
+        super().__init__(message)
+        self.response = response
+
+
+class ReplayResponse:
+    def __init__(self, entry: dict[str, Any]) -> None:
+        self.status_code = int(entry.get("status", 200))
+        self.headers = ReplayHeaders(entry.get("headers") or {})
+        self._json = entry.get("json")
+        self._text = entry.get("text")
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = json.dumps(self._json, ensure_ascii=False)
+        return self._text
+
+    def json(self) -> Any:
+        if self._json is None:
+            return json.loads(self._text or "null")
+        return self._json
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise ReplayHTTPError(f"HTTP {self.status_code} (replay)", self)
+
+
+_FIXTURES: dict[tuple[str, float], dict[str, list[dict[str, Any]]]] = {}
+_FIXTURES_LOCK = threading.Lock()
+
+
+def load_fixture(path: str | Path) -> dict[str, list[dict[str, Any]]]:
+    # 按 (路径, 修改时间) 缓存解析结果，同一夹具被多个客户端回放时只读一次。
+    p = Path(path)
+    cache_key = (str(p.resolve()), p.stat().st_mtime)
+    with _FIXTURES_LOCK:
+        cached = _FIXTURES.get(cache_key)
+        if cached is not None:
+            return cached
+    entries: dict[str, list[dict[str, Any]]] = {}
+    with _open(p, "r") as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            entries.setdefault(entry["key"], []).append(entry)
+    with _FIXTURES_LOCK:
+        _FIXTURES[cache_key] = entries
+    return entries
+
+
+# 回放通道：按请求键从夹具取响应，不发网络请求。同一键有多条时按录制顺序依次返回，用完后重复最后一条。
+class ReplaySession:
+    def __init__(self, path: str | Path) -> None:
+        if not path:
+            raise ValueError("transport=replay 需要指定夹具文件(fixture 参数或 ICP_REPLAY_FILE)")
+        self.path = Path(path)
+        self.entries = load_fixture(self.path)
+        self.headers: dict[str, str] = {}
+        self.cookies: dict[str, str] = {}
+        self._cursor: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def post(self, url: str, json: Any = None, data: Any = None, **kwargs: Any) -> ReplayResponse:
+        key = request_key(url, json, data)
+        recorded = self.entries.get(key)
+        if not recorded:
+            raise ReplayMissError(f"夹具 {self.path} 中没有该请求: {key[:200]}")
+        with self._lock:
+            i = self._cursor.get(key, 0)
+            self._cursor[key] = i + 1
+        return ReplayResponse(recorded[min(i, len(recorded) - 1)])
+
+    def close(self) -> None:
+        pass
+
+
+# 录制通道：包装真实会话(curl_cffi/requests，同步或异步)，每个请求/响应对追加写入夹具文件。
+# 文件只打开一次，逐条写入并 flush；close() 或对象回收/进程退出时关闭(.gz 此时写入结尾)。
+class RecordingSession:
+    def __init__(self, inner: Any, path: str | Path) -> None:
+        self.inner = inner
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._fh = _open(self.path, "a")
+        self._finalizer = weakref.finalize(self, self._fh.close)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.inner, name)
+
+    def _record(self, url: str, kwargs: dict[str, Any], resp: Any) -> None:
+        headers = {h: resp.headers.get(h) for h in RECORDED_HEADERS if resp.headers.get(h) is not None}
+        entry: dict[str, Any] = {
+            "key": request_key(url, kwargs.get("json"), kwargs.get("data")),
+            "status": resp.status_code,
+            "headers": headers,
+        }
+        try:
+            entry["json"] = resp.json()
+        except Exception:
+            entry["text"] = resp.text
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._fh.write(line)
+            self._fh.flush()
+
+    async def _record_async(self, url: str, kwargs: dict[str, Any], pending: Any) -> Any:
+        resp = await pending
+        self._record(url, kwargs, resp)
+        return resp
+
+    def post(self, url: str, **kwargs: Any) -> Any:
+        result = self.inner.post(url, **kwargs)
+        if inspect.isawaitable(result):
+            return self._record_async(url, kwargs, result)
+        self._record(url, kwargs, result)
+        return result
+
+    def close(self) -> Any:
+        # 异步会话的 close() 返回协程，原样交给调用方 await。
+        with self._lock:
+            self._finalizer()
+        return self.inner.close()
+
@@ -0,0 +1,254 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable
+
+
+DEFAULT_SESSION_TTL = 15 * 60
+DEFAULT_MAX_SESSIONS = 200
+DEFAULT_STATE_FILE = "icp_state.sqlite3"
+# 单个会话常驻开销的粗略估计(HTTP 会话、连接缓冲等)，仅用于内存水位观测。
+SESSION_BASE_BYTES = 256 * 1024
+
+
+# 查询会话存储：条数上限 + LRU 淘汰 + TTL 过期，所有操作加锁。
+# OrderedDict 按最近访问排序，过期清理只需从队头扫到第一个未过期的会话。
+class QuerySessionStore:
+    def __init__(
+        self,
+        ttl: int = DEFAULT_SESSION_TTL,
+        max_entries: int = DEFAULT_MAX_SESSIONS,
+        on_evict: Callable[[dict[str, Any]], None] | None = None,
+    ) -> None:
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.on_evict = on_evict
+        self._lock = threading.RLock()
+        self._items: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        self.evicted = 0
+        self.expired = 0
+
+    def _evict(self, evicted: list[dict[str, Any]]) -> None:
+        if self.on_evict is None:
+            return
+        for sess in evicted:
+            try:
+                self.on_evict(sess)
+            except Exception:
+                pass
+
+    def put(self, session_id: str, sess: dict[str, Any]) -> None:
+        evicted: list[dict[str, Any]] = []
+        with self._lock:
+            sess["updated_at"] = time.time()
+            self._items[session_id] = sess
+            self._items.move_to_end(session_id)
+            while len(self._items) > self.max_entries:
+                _, old = self._items.popitem(last=False)
+                evicted.append(old)
+                self.evicted += 1
+        self._evict(evicted)
+
+    def get(self, session_id: str) -> dict[str, Any] | None:
+        now = time.time()
+        evicted: list[dict[str, Any]] = []
+        with self._lock:
+            sess = self._items.get(session_id)
+            if sess is None:
+                return None
+            if now - float(sess.get("updated_at", 0)) > self.ttl:
+                self._items.pop(session_id, None)
+                self.expired += 1
+                evicted.append(sess)
+                sess = None
+            else:
+                sess["updated_at"] = now
+                self._items.move_to_end(session_id)
+        self._evict(evicted)
+        return sess
+
+    def pop(self, session_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            sess = self._items.pop(session_id, None)
+        if sess is not None:
+            self._evict([sess])
+        return sess
+
+    def reap(self) -> int:
+        cutoff = time.time() - self.ttl
+        evicted: list[dict[str, Any]] = []
+        with self._lock:
+            while self._items:
+                sess = next(iter(self._items.values()))
+                if float(sess.get("updated_at", 0)) >= cutoff:
+                    break
+                self._items.popitem(last=False)
+                evicted.append(sess)
+            self.expired += len(evicted)
+        self._evict(evicted)
+        return len(evicted)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._items)
+
+    def __contains__(self, session_id: object) -> bool:
+        with self._lock:
+            return session_id in self._items
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            page_bytes = sum(sum((sess.get("page_sizes") or {}).values()) for sess in self._items.values())
+            live = len(self._items)
+            return {
+                "live_sessions": live,
+                "max_sessions": self.max_entries,
+                "approx_bytes": live * SESSION_BASE_BYTES + page_bytes,
+                "evicted": self.evicted,
+                "expired": self.expired,
+            }
+
+
+# ---- 可跨进程共享的会话状态后端 ----
+# 多 worker 部署时，会话的可序列化状态(token/uuid/sign/rci/cookies/keyword/page_size 等)
+# 放在共享后端里，任意 worker 收到翻页请求都能据此还原客户端。
+
+
+class MemoryStateBackend:
+    # 默认后端，仅进程内有效，适合单 worker。
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._items: dict[str, tuple[float, str]] = {}
+
+    def get(self, session_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            item = self._items.get(session_id)
+            if item is None:
+                return None
+            if item[0] < time.time():
+                self._items.pop(session_id, None)
+                return None
+            return json.loads(item[1])
+
+    def set(self, session_id: str, state: dict[str, Any], ttl: int) -> None:
+        payload = json.dumps(state, ensure_ascii=False)
+        with self._lock:
+            now = time.time()
+            if len(self._items) > 1024:
+                for sid in [sid for sid, (expires_at, _) in self._items.items() if expires_at < now]:
+                    self._items.pop(sid, None)
+            self._items[session_id] = (now + ttl, payload)
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._items.pop(session_id, None)
+
+
+class SqliteStateBackend:
+    # 同机多 worker 共享同一个 SQLite 文件。
+    def __init__(self, path: str | Path) -> None:
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS session_state ("
+                " session_id TEXT PRIMARY KEY,"
+                " expires_at REAL NOT NULL,"
+                " payload TEXT NOT NULL)"
+            )
+
+    def get(self, session_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT expires_at, payload FROM session_state WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+        if row is None or float(row[0]) < time.time():
+            return None
+        return json.loads(row[1])
+
+    def set(self, session_id: str, state: dict[str, Any], ttl: int) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO session_state (session_id, expires_at, payload) VALUES (?, ?, ?)",
+                (session_id, now + ttl, json.dumps(state, ensure_ascii=False)),
+            )
+            self._conn.execute("DELETE FROM session_state WHERE expires_at < ?", (now,))
+
+    def delete(self, session_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM session_state WHERE session_id = ?", (session_id,))
+
+
+class LocalRedis:
+    # redis-py 客户端 get/set(ex=)/delete 子集的进程内替身，便于无 Redis 时开发和测试 RedisStateBackend。
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._data: dict[str, tuple[float | None, bytes]] = {}
+
+    def get(self, name: str) -> bytes | None:
+        with self._lock:
+            item = self._data.get(name)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at is not None and expires_at < time.time():
+                self._data.pop(name, None)
+                return None
+            return value
+
+    def set(self, name: str, value: str | bytes, ex: int | None = None) -> bool:
+        raw = value.encode("utf-8") if isinstance(value, str) else value
+        with self._lock:
+            self._data[name] = (time.time() + ex if ex else None, raw)
+        return True
+
+    def delete(self, *names: str) -> int:
+        with self._lock:
+            return sum(1 for name in names if self._data.pop(name, None) is not None)
+
+
+class RedisStateBackend:
+    # 跨主机部署时使用；client 只需提供 redis-py 风格的 get/set(ex=)/delete。
+    def __init__(self, client: Any, prefix: str = "icp:session:") -> None:
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, session_id: str) -> dict[str, Any] | None:
+        raw = self.client.get(self.prefix + session_id)
+        if raw is None:
+            return None
+        if isinstance(raw, bytes):
+            raw = raw.decode("utf-8")
+        return json.loads(raw)
+
+    def set(self, session_id: str, state: dict[str, Any], ttl: int) -> None:
+        self.client.set(self.prefix + session_id, json.dumps(state, ensure_ascii=False), ex=max(1, int(ttl)))
+
+    def delete(self, session_id: str) -> None:
+        self.client.delete(self.prefix + session_id)
+
+
+def make_state_backend(kind: str = "memory", path: str = DEFAULT_STATE_FILE, redis_url: str = "") -> Any:
+    kind = (kind or "memory").lower()
+    if kind == "memory":
+        return MemoryStateBackend()
+    if kind == "sqlite":
+        return SqliteStateBackend(path or DEFAULT_STATE_FILE)
+    if kind == "local-redis":
+        # 仅进程内有效，用于本地开发/测试 RedisStateBackend，不能在多 worker 间共享。
+        return RedisStateBackend(LocalRedis())
+    if kind == "redis":
+        if not redis_url:
+            raise ValueError("ICP_STATE_BACKEND=redis 需要设置 ICP_REDIS_URL，否则各 worker 的会话状态无法共享")
+        try:
+            import redis
+        except ImportError as exc:
+            raise RuntimeError("ICP_STATE_BACKEND=redis 需要安装 redis 包: pip install redis") from exc
+        return RedisStateBackend(redis.Redis.from_url(redis_url))
+    raise ValueError(f"unknown state backend: {kind}")
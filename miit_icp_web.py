@@ -1,19 +1,72 @@
-import csv
-import io
+import asyncio
+import json
+import os
 import time
 import uuid
-from typing import Any
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Iterable, Iterator
 
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field
 
-from miit_icp_auto_query import MiitIcpAutoClient
+from miit_icp_auto_query import (
+    DEFAULT_POOL_IDLE_TTL,
+    DEFAULT_POOL_MAX_IDLE,
+    DEFAULT_POOL_MAX_SIZE,
+    DETAIL_CACHE,
+    DETAIL_SHAPES,
+    OFFSET_POOL,
+    TRANSPORTS,
+    AsyncClientPool,
+    AsyncMiitIcpAutoClient,
+    PoolExhaustedError,
+)
+from miit_icp_cache import DEFAULT_CACHE_FILE, DEFAULT_CACHE_MAX_ENTRIES, DEFAULT_CACHE_TTL, ResultCache
+from miit_icp_export import (
+    BINARY_EXPORTS,
+    EXPORT_FORMATS,
+    iter_csv_chunks,
+    iter_jsonl_chunks,
+    query_type_of,
+    record_columns,
+)
+from miit_icp_index import DEFAULT_INDEX_FILE, DEFAULT_SEARCH_LIMIT, SEARCH_MODES, RecordIndex
+from miit_icp_metrics import HTTP_REQUESTS, HTTP_SECONDS, REGISTRY, RETRIES, STAGE_SECONDS
+from miit_icp_sessions import DEFAULT_MAX_SESSIONS, DEFAULT_STATE_FILE, QuerySessionStore, make_state_backend
+from miit_icp_jobs import (
+    DEFAULT_JOB_DB_FILE,
+    DEFAULT_JOB_MAX_PENDING,
+    DEFAULT_JOB_STALE_AFTER,
+    DEFAULT_JOB_WORKERS,
+    JobManager,
+    JobPaused,
+    JobQueueFull,
+    JobStore,
+)
 
 
 app = FastAPI(title="MIIT ICP Query Web")
 QUERY_SESSION_TTL = 15 * 60
-QUERY_SESSIONS: dict[str, dict[str, Any]] = {}
+QUERY_SESSION_REAP_INTERVAL = 60
+# 每个查询会话最多缓存的已补全页数。
+SESSION_PAGE_CACHE_SIZE = 20
+RESULT_CACHE = ResultCache(
+    os.environ.get("ICP_CACHE_FILE", DEFAULT_CACHE_FILE),
+    ttl=int(os.environ.get("ICP_CACHE_TTL", DEFAULT_CACHE_TTL)),
+    max_entries=int(os.environ.get("ICP_CACHE_MAX_ENTRIES", DEFAULT_CACHE_MAX_ENTRIES)),
+)
+# 查询结果按记录写入本地索引，供 /api/index/search 离线检索；ICP_INDEX_FILE 置空关闭。
+_INDEX_FILE = os.environ.get("ICP_INDEX_FILE", DEFAULT_INDEX_FILE)
+RECORD_INDEX = RecordIndex(_INDEX_FILE) if _INDEX_FILE else None
+BATCH_MAX_KEYWORDS = 100
+# 补调详情接口的并发上限，过高容易触发风控。
+ENRICH_CONCURRENCY = max(1, int(os.environ.get("ICP_ENRICH_CONCURRENCY", "4")))
+# 设置了 ICP_REPLAY_FILE 时才允许 transport=replay，从录制的夹具离线回放。
+WEB_TRANSPORTS = TRANSPORTS if os.environ.get("ICP_REPLAY_FILE") else ("curl", "requests")
+JOB_MAX_KEYWORDS = 5000
+SESSION_EXPORT_MAX_PAGES = 2000
+JOB_EXPORT_BATCH = 200
 
 
 HTML_PAGE = """<!doctype html>
@@ -498,7 +551,7 @@ sf-express.com</textarea>
           const resp = await fetch("/api/start_query", {
             method: "POST",
             headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({ keyword: keywords[0], page_size: localPageSize, ...commonPayload })
+            body: JSON.stringify({ keyword: keywords[0], page_size: localPageSize, prefetch: true, ...commonPayload })
           });
           const data = await resp.json();
           if (!resp.ok) throw new Error(data.detail || "Query failed");
@@ -518,29 +571,52 @@ sf-express.com</textarea>
           setStatus("Loaded page " + remotePage + "/" + remotePages + ", total " + remoteTotal + " (lazy paging)", false);
         } else {
           const delaySec = Number(document.getElementById("delaySec").value);
-          const resp = await fetch("/api/batch_query", {
+          const resp = await fetch("/api/batch_query_stream", {
             method: "POST",
             headers: { "Content-Type": "application/json" },
             body: JSON.stringify({ keywords, delay_sec: delaySec, ...commonPayload })
           });
-          const data = await resp.json();
-          if (!resp.ok) throw new Error(data.detail || "Batch query failed");
-          lastResults = data.results || [];
+          if (!resp.ok) {
+            const data = await resp.json().catch(() => ({}));
+            throw new Error(data.detail || "Batch query failed");
+          }
           let seq = 1;
-          for (const g of lastResults) {
+          const onRow = function(g) {
+            lastResults.push(g);
             if (!g.ok) {
               localRows.push({ seq: seq++, query: g.query || "", status: "Success", error: g.error || "", record: null });
-              continue;
-            }
-            const rs = Array.isArray(g.records) ? g.records : [];
-            if (!rs.length) {
-              localRows.push({ seq: seq++, query: g.query || "", status: "Success", error: "", record: {} });
-              continue;
+            } else {
+              const rs = Array.isArray(g.records) ? g.records : [];
+              if (!rs.length) {
+                localRows.push({ seq: seq++, query: g.query || "", status: "Success", error: "", record: {} });
+              }
+              for (const rec of rs) {
+                localRows.push({ seq: seq++, query: g.query || "", status: "Success", error: "", record: rec || {} });
+              }
             }
-            for (const rec of rs) {
-              localRows.push({ seq: seq++, query: g.query || "", status: "Success", error: "", record: rec || {} });
+            renderLocalPager();
+            csvBtn.disabled = localRows.length === 0;
+            setStatus("Searching... " + lastResults.length + "/" + keywords.length, false);
+          };
+          // NDJSON 流：每查完一个关键词到达一行，收到即渲染。
+          const reader = resp.body.getReader();
+          const decoder = new TextDecoder("utf-8");
+          const NL = String.fromCharCode(10);
+          let buf = "";
+          while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buf += decoder.decode(value, { stream: true });
+            let pos = buf.indexOf(NL);
+            while (pos >= 0) {
+              const line = buf.slice(0, pos).trim();
+              buf = buf.slice(pos + 1);
+              if (line) onRow(JSON.parse(line));
+              pos = buf.indexOf(NL);
             }
           }
+          buf += decoder.decode();
+          if (buf.trim()) onRow(JSON.parse(buf.trim()));
           renderLocalPager();
           const okCount = lastResults.filter(x => x.ok).length;
           setStatus("Done: " + okCount + "/" + lastResults.length + " succeeded", okCount !== lastResults.length);
@@ -554,6 +630,13 @@ sf-express.com</textarea>
     }
 
     async function exportCsv() {
+      if (remoteSessionId) {
+        // 单关键词分页查询：由服务端翻完全部页后导出，不回传已加载的数据。
+        const link = document.createElement("a");
+        link.href = "/api/query_sessions/" + encodeURIComponent(remoteSessionId) + "/export?format=csv";
+        link.click();
+        return;
+      }
       if (!lastResults.length) return;
       const resp = await fetch("/api/export_csv", {
         method: "POST",
@@ -734,6 +817,8 @@ class BatchQueryRequest(BaseModel):
     retries: int = 8
     transport: str = "curl"
     delay_sec: float = 0.2
+    max_age: int | None = None
+    refresh: bool = False
 
 
 class ExportRequest(BaseModel):
@@ -746,6 +831,7 @@ class StartQueryRequest(BaseModel):
     retries: int = 8
     transport: str = "curl"
     page_size: int = 10
+    prefetch: bool = False
 
 
 class QueryPageRequest(BaseModel):
@@ -753,11 +839,6 @@ class QueryPageRequest(BaseModel):
     page_num: int = 1
 
 
-def _is_domain(text: str) -> bool:
-    t = text.strip().lower()
-    return "." in t and " " not in t
-
-
 def _merge_detail_into_record(record: dict[str, Any], detail_resp: dict[str, Any]) -> dict[str, Any]:
     merged = dict(record or {})
     params = (detail_resp or {}).get("params")
@@ -779,51 +860,169 @@ def _merge_detail_into_record(record: dict[str, Any], detail_resp: dict[str, Any
     return merged
 
 
-def _cleanup_query_sessions() -> None:
-    now = time.time()
-    expired = [
-        sid
-        for sid, sess in QUERY_SESSIONS.items()
-        if now - float(sess.get("updated_at", 0)) > QUERY_SESSION_TTL
-    ]
-    for sid in expired:
-        QUERY_SESSIONS.pop(sid, None)
+CLIENT_POOL = AsyncClientPool(
+    max_idle=int(os.environ.get("ICP_CLIENT_POOL_SIZE", DEFAULT_POOL_MAX_IDLE)),
+    idle_ttl=int(os.environ.get("ICP_CLIENT_POOL_IDLE_TTL", DEFAULT_POOL_IDLE_TTL)),
+    max_size=int(os.environ.get("ICP_CLIENT_POOL_MAX_SIZE", DEFAULT_POOL_MAX_SIZE)),
+)
+POOL_EXHAUSTED_DETAIL = "查询客户端已全部占用，请稍后重试"
+BATCH_BLOCKED_ERROR = "查询被风控拦截(HTTP 403)，建议暂停后重试。"
+
+
+# 归还/关闭会话客户端的后台任务；保留引用，避免任务执行前被回收。
+_SESSION_CLOSE_TASKS: set["asyncio.Task[None]"] = set()
 
 
-def _get_query_session(session_id: str) -> dict[str, Any]:
-    _cleanup_query_sessions()
+async def _dispose_session_client(client: AsyncMiitIcpAutoClient, pooled: bool, reusable: bool = True) -> None:
+    # 从连接池借出的客户端归还；从共享状态还原的客户端不属于连接池，直接关闭其 HTTP 会话。
+    if pooled:
+        await CLIENT_POOL.release(client, reusable=reusable)
+    else:
+        await client.close()
+
+
+def _acquire_session(sess: dict[str, Any]) -> None:
+    # 在途的翻页/导出请求计数；会话关闭后要等计数归零才归还客户端，避免借给别人的同时还在使用。
+    sess["busy"] = sess.get("busy", 0) + 1
+
+
+def _leave_session(sess: dict[str, Any]) -> None:
+    sess["busy"] = max(0, sess.get("busy", 0) - 1)
+    _release_session_client(sess)
+
+
+def _release_session_client(sess: dict[str, Any]) -> None:
+    if not sess.get("closed") or sess.get("busy") or sess.get("released"):
+        return
+    sess["released"] = True
+    client = sess.get("client")
+    if client is None:
+        return
+    pooled = bool(sess.get("pooled"))
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # 不在事件循环中(例如从其它线程淘汰)：不放回连接池，交给会话所属的事件循环关闭客户端。
+        owner = sess.get("loop")
+        if owner is not None and owner.is_running():
+            asyncio.run_coroutine_threadsafe(_dispose_session_client(client, pooled, reusable=False), owner)
+        return
+    task = loop.create_task(_dispose_session_client(client, pooled, reusable=not sess.get("interrupted")))
+    _SESSION_CLOSE_TASKS.add(task)
+    task.add_done_callback(_SESSION_CLOSE_TASKS.discard)
+
+
+def _close_query_session(sess: dict[str, Any]) -> None:
+    # 会话被淘汰/过期时取消未完成的翻页任务；客户端在最后一个在途请求结束后归还或关闭。
+    sess["closed"] = True
+    for task in list((sess.get("page_tasks") or {}).values()):
+        # 被中断的请求可能还在线程里使用该客户端的 HTTP 会话，这种客户端不再放回连接池。
+        if not task.done():
+            sess["interrupted"] = True
+        task.cancel()
+    _release_session_client(sess)
+
+
+QUERY_SESSIONS = QuerySessionStore(
+    ttl=QUERY_SESSION_TTL,
+    max_entries=int(os.environ.get("ICP_MAX_QUERY_SESSIONS", DEFAULT_MAX_SESSIONS)),
+    on_evict=_close_query_session,
+)
+
+
+# 会话的可序列化状态放在共享后端；多 worker 部署时用 sqlite/redis，翻页请求落到任意 worker 都能继续。
+STATE_BACKEND = make_state_backend(
+    os.environ.get("ICP_STATE_BACKEND", "memory"),
+    path=os.environ.get("ICP_STATE_FILE", DEFAULT_STATE_FILE),
+    redis_url=os.environ.get("ICP_REDIS_URL", ""),
+)
+
+
+def _save_session_state(sess: dict[str, Any]) -> None:
+    state = sess["client"].export_state()
+    state.update(
+        keyword=sess["keyword"],
+        service_type=sess["service_type"],
+        page_size=sess["page_size"],
+        prefetch=bool(sess.get("prefetch")),
+    )
+    STATE_BACKEND.set(sess["session_id"], state, QUERY_SESSION_TTL)
+
+
+async def _get_query_session(session_id: str) -> dict[str, Any]:
+    # 返回的会话已计入在途请求，调用方用完后必须调用 _leave_session。
+    # 状态后端可能是 sqlite/redis，读写都放到线程里，不阻塞事件循环。
     sess = QUERY_SESSIONS.get(session_id)
-    if not sess:
+    if sess:
+        _acquire_session(sess)
+        await _save_session_state_or_leave(sess)
+        return sess
+    # 本 worker 没有该会话(由其它 worker 创建，或已被本地淘汰)：按共享状态还原客户端。
+    state = await asyncio.to_thread(STATE_BACKEND.get, session_id)
+    if not state:
         raise HTTPException(status_code=404, detail="查询会话不存在或已过期，请重新搜索")
-    sess["updated_at"] = time.time()
+    # 读取状态期间并发请求可能已还原同一会话，直接复用，避免多建一个客户端并被覆盖后泄漏。
+    existing = QUERY_SESSIONS.get(session_id)
+    if existing:
+        _acquire_session(existing)
+        return existing
+    client = AsyncMiitIcpAutoClient(transport=state.get("transport") or "curl")
+    client.restore_state(state)
+    sess = {
+        "session_id": session_id,
+        "client": client,
+        "pooled": False,
+        "loop": asyncio.get_running_loop(),
+        "keyword": state["keyword"],
+        "service_type": int(state["service_type"]),
+        "page_size": int(state["page_size"]),
+        "prefetch": bool(state.get("prefetch")),
+    }
+    _acquire_session(sess)
+    QUERY_SESSIONS.put(session_id, sess)
+    await _save_session_state_or_leave(sess)
     return sess
 
 
-def _enrich_app_records(
-    client: MiitIcpAutoClient,
+async def _save_session_state_or_leave(sess: dict[str, Any]) -> None:
+    try:
+        await asyncio.to_thread(_save_session_state, sess)
+    except BaseException:
+        _leave_session(sess)
+        raise
+
+
+async def _enrich_app_records(
+    client: AsyncMiitIcpAutoClient,
     records: list[Any],
     service_type: int,
+    concurrency: int | None = None,
 ) -> list[Any]:
     if service_type not in (6, 7, 8):
         return records
-    enriched: list[Any] = []
-    for rec in records:
+    semaphore = asyncio.Semaphore(max(1, concurrency or ENRICH_CONCURRENCY))
+
+    async def enrich_one(rec: Any) -> Any:
         if not isinstance(rec, dict):
-            enriched.append(rec)
-            continue
+            return rec
         data_id = rec.get("dataId") or rec.get("serviceId") or rec.get("id")
         if not data_id:
-            enriched.append(rec)
-            continue
-        try:
-            detail = client.query_detail_by_app_and_mini_id(data_id, service_type=service_type)
-            enriched.append(_merge_detail_into_record(rec, detail))
-        except Exception:
-            enriched.append(rec)
+            return rec
+        async with semaphore:
+            try:
+                detail = await client.query_detail_by_app_and_mini_id(data_id, service_type=service_type)
+            except Exception:
+                return rec
+        return _merge_detail_into_record(rec, detail)
+
+    # 同时在途的详情请求不超过 concurrency 个；gather 按输入顺序返回，结果顺序不变。
+    started = time.perf_counter()
+    enriched = list(await asyncio.gather(*(enrich_one(rec) for rec in records)))
+    STAGE_SECONDS.observe(time.perf_counter() - started, "enrich")
     return enriched
 
 
-def _fetch_page_with_session(
+async def _fetch_page_with_session(
     sess: dict[str, Any],
     page_num: int,
 ) -> dict[str, Any]:
@@ -832,7 +1031,7 @@ def _fetch_page_with_session(
     service_type = int(sess["service_type"])
     page_size = int(sess["page_size"])
 
-    raw = client.query_company(
+    raw = await client.query_company(
         keyword,
         service_type=service_type,
         page_num=max(1, page_num),
@@ -842,18 +1041,13 @@ def _fetch_page_with_session(
     records = params.get("list") or []
     if not isinstance(records, list):
         records = []
-    records = _enrich_app_records(client, records, service_type)
-
-    all_keys: set[str] = set()
-    for rec in records:
-        if isinstance(rec, dict):
-            all_keys.update(rec.keys())
+    records = await _enrich_app_records(client, records, service_type)
 
     return {
         "query": keyword,
-        "query_type": "域名" if _is_domain(keyword) else "主体",
+        "query_type": query_type_of(keyword),
         "ok": True,
-        "record_columns": sorted(all_keys),
+        "record_columns": record_columns(records),
         "records": records,
         "pageNum": int(params.get("pageNum") or page_num or 1),
         "pageSize": int(params.get("pageSize") or page_size),
@@ -862,8 +1056,70 @@ def _fetch_page_with_session(
     }
 
 
-def _query_with_client(
-    client: MiitIcpAutoClient,
+def _store_session_page(sess: dict[str, Any], page_num: int, page: dict[str, Any]) -> None:
+    pages: OrderedDict[int, dict[str, Any]] = sess.setdefault("pages", OrderedDict())
+    page_sizes: dict[int, int] = sess.setdefault("page_sizes", {})
+    pages[page_num] = page
+    pages.move_to_end(page_num)
+    page_sizes[page_num] = len(json.dumps(page.get("records") or [], ensure_ascii=False))
+    while len(pages) > SESSION_PAGE_CACHE_SIZE:
+        old_page, _ = pages.popitem(last=False)
+        page_sizes.pop(old_page, None)
+
+
+async def _fetch_session_page(sess: dict[str, Any], page_num: int) -> dict[str, Any]:
+    try:
+        page = await _fetch_page_with_session(sess, page_num)
+        # 翻页后 rci/cookies 可能更新，同步回共享状态。
+        if "session_id" in sess:
+            await asyncio.to_thread(_save_session_state, sess)
+        _store_session_page(sess, page_num, page)
+        return page
+    finally:
+        sess["page_tasks"].pop(page_num, None)
+
+
+def _start_page_task(sess: dict[str, Any], page_num: int) -> "asyncio.Task[dict[str, Any]]":
+    # 在途的翻页任务登记在 sess["page_tasks"]：同一页的并发请求共用，会话关闭时统一取消，也保证任务不被提前回收。
+    tasks: dict[int, asyncio.Task[dict[str, Any]]] = sess.setdefault("page_tasks", {})
+    task = tasks.get(page_num)
+    if task is None:
+        task = asyncio.ensure_future(_fetch_session_page(sess, page_num))
+        tasks[page_num] = task
+        # 任务在开始执行前就可能被取消，在途计数用完成回调释放，而不是放在协程的 finally 里。
+        _acquire_session(sess)
+        task.add_done_callback(lambda _t: _leave_session(sess))
+    return task
+
+
+async def _load_session_page(sess: dict[str, Any], page_num: int) -> dict[str, Any]:
+    # 已看过的页直接从会话缓存返回；同一页的并发请求(含预取)共用一次上游查询。
+    pages: OrderedDict[int, dict[str, Any]] = sess.setdefault("pages", OrderedDict())
+    if page_num in pages:
+        pages.move_to_end(page_num)
+        return pages[page_num]
+    return await asyncio.shield(_start_page_task(sess, page_num))
+
+
+def _drop_prefetch_error(task: "asyncio.Task[dict[str, Any]]") -> None:
+    # 预取失败不影响当前请求，用户真正翻到该页时会重新查询。
+    if not task.cancelled():
+        task.exception()
+
+
+def _prefetch_next_page(sess: dict[str, Any], page_data: dict[str, Any]) -> None:
+    if not sess.get("prefetch"):
+        return
+    next_page = int(page_data.get("pageNum") or 1) + 1
+    if next_page > int(page_data.get("pages") or 1):
+        return
+    if next_page in sess.get("pages", {}) or next_page in sess.get("page_tasks", {}):
+        return
+    _start_page_task(sess, next_page).add_done_callback(_drop_prefetch_error)
+
+
+async def _query_with_client(
+    client: AsyncMiitIcpAutoClient,
     keyword: str,
     service_type: int,
     retries: int,
@@ -874,17 +1130,18 @@ def _query_with_client(
     used_offset = -1
     for _ in range(max(1, retries)):
         try:
-            image_payload = client.get_check_images()
-            used_offset, _ = client.verify_slider(image_payload)
+            image_payload = await client.get_check_images()
+            used_offset, _ = await client.verify_slider(image_payload)
             break
         except Exception as exc:
             last_err = exc
-            time.sleep(0.3)
+            RETRIES.inc("captcha")
+            await asyncio.sleep(0.3)
     else:
         raise RuntimeError(f"captcha verify failed: {last_err}")
 
     # 官方 ICP 备案查询前端使用 unitName + serviceType 参数；实测域名关键词也可查到主体信息。
-    raw = client.query_company_all(
+    raw = await client.query_company_all(
         keyword,
         service_type=service_type,
         page_size=max(1, page_size),
@@ -894,40 +1151,77 @@ def _query_with_client(
     records = params.get("list") or []
 
     # APP/小程序/快应用：按官方流程补调 queryDetailByAppAndMiniId，拿到访问名称等详情字段。
-    if service_type in (6, 7, 8):
-        enriched: list[dict[str, Any]] = []
-        for rec in records:
-            if not isinstance(rec, dict):
-                enriched.append(rec)
-                continue
-            data_id = rec.get("dataId") or rec.get("serviceId") or rec.get("id")
-            if not data_id:
-                enriched.append(rec)
-                continue
-            try:
-                detail = client.query_detail_by_app_and_mini_id(data_id, service_type=service_type)
-                enriched.append(_merge_detail_into_record(rec, detail))
-            except Exception:
-                enriched.append(rec)
-        records = enriched
+    records = await _enrich_app_records(client, records, service_type)
+
+    # 缓存里存补全后的记录，命中时无需再调详情接口。
+    cached_raw = dict(raw)
+    cached_raw["params"] = {**params, "list": records}
+    await asyncio.to_thread(_store_result, keyword, service_type, cached_raw, max(1, max_pages) * max(1, page_size))
+    return _build_result_row(keyword, raw, records, used_offset)
+
+
+def _store_result(keyword: str, service_type: int, cached_raw: dict[str, Any], depth: int) -> None:
+    # 写结果缓存与索引都是 SQLite 同步调用，由调用方放到线程里执行。
+    RESULT_CACHE.put(keyword, service_type, cached_raw, enriched=service_type in (6, 7, 8), depth=depth)
+    if RECORD_INDEX is not None:
+        RECORD_INDEX.add_result(keyword, service_type, cached_raw)
 
-    all_keys: set[str] = set()
-    for rec in records:
-        if isinstance(rec, dict):
-            all_keys.update(rec.keys())
 
+def _build_result_row(
+    keyword: str,
+    raw: dict[str, Any],
+    records: list[Any],
+    offset: int,
+    cached: bool = False,
+) -> dict[str, Any]:
     return {
         "query": keyword,
-        "query_type": "域名" if _is_domain(keyword) else "主体",
+        "query_type": query_type_of(keyword),
         "ok": True,
         "count": len(records),
-        "offset": used_offset,
-        "record_columns": sorted(all_keys),
+        "offset": offset,
+        "cached": cached,
+        "record_columns": record_columns(records),
         "records": records,
         "raw": raw,
     }
 
 
+def _batch_depth(req: BatchQueryRequest) -> int:
+    return max(1, req.max_pages) * max(1, req.page_size)
+
+
+def _all_cached(req: BatchQueryRequest, keywords: list[str]) -> bool:
+    # 只看是否命中，不加载结果内容；遇到第一个未命中即返回。
+    if req.refresh:
+        return False
+    depth = _batch_depth(req)
+    enriched = req.service_type in (6, 7, 8)
+    return all(
+        RESULT_CACHE.contains(kw, req.service_type, max_age=req.max_age, require_enriched=enriched, depth=depth)
+        for kw in keywords
+    )
+
+
+def _cached_result_row(
+    keyword: str,
+    service_type: int,
+    max_age: int | None,
+    depth: int | None = None,
+) -> dict[str, Any] | None:
+    raw = RESULT_CACHE.get(
+        keyword,
+        service_type,
+        max_age=max_age,
+        require_enriched=service_type in (6, 7, 8),
+        depth=depth,
+    )
+    if raw is None:
+        return None
+    records = (raw.get("params") or {}).get("list") or []
+    return _build_result_row(keyword, raw, records, offset=-1, cached=True)
+
+
 @app.get("/", response_class=HTMLResponse)
 def home() -> str:
     return HTMLResponse(
@@ -941,71 +1235,123 @@ def home() -> str:
 
 
 @app.post("/api/start_query")
-def start_query(req: StartQueryRequest) -> dict[str, Any]:
+async def start_query(req: StartQueryRequest) -> dict[str, Any]:
     keyword = (req.keyword or "").strip()
     if not keyword:
         raise HTTPException(status_code=400, detail="keyword 不能为空")
-    if req.transport not in ("curl", "requests"):
-        raise HTTPException(status_code=400, detail="transport 仅支持 curl/requests")
+    if req.transport not in WEB_TRANSPORTS:
+        raise HTTPException(status_code=400, detail=f"transport 仅支持 {'/'.join(WEB_TRANSPORTS)}")
     if req.page_size <= 0 or req.page_size > 200:
         raise HTTPException(status_code=400, detail="page_size 需在 1~200 之间")
 
-    client = MiitIcpAutoClient(transport=req.transport)
     try:
-        client.auth()
+        client = await CLIENT_POOL.acquire(req.transport)
+    except PoolExhaustedError:
+        raise HTTPException(status_code=503, detail=POOL_EXHAUSTED_DETAIL)
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"鉴权失败: {exc}")
 
     last_err: Exception | None = None
     for _ in range(max(1, req.retries)):
         try:
-            image_payload = client.get_check_images()
-            client.verify_slider(image_payload)
+            image_payload = await client.get_check_images()
+            await client.verify_slider(image_payload)
             break
         except Exception as exc:
             last_err = exc
-            time.sleep(0.3)
+            RETRIES.inc("captcha")
+            await asyncio.sleep(0.3)
     else:
+        await CLIENT_POOL.release(client)
         raise HTTPException(status_code=500, detail=f"验证码失败: {last_err}")
 
     session_id = uuid.uuid4().hex
     sess = {
+        "session_id": session_id,
         "client": client,
+        "pooled": True,
+        "loop": asyncio.get_running_loop(),
         "keyword": keyword,
         "service_type": req.service_type,
         "page_size": req.page_size,
-        "updated_at": time.time(),
+        "prefetch": req.prefetch,
     }
-    QUERY_SESSIONS[session_id] = sess
-    page_data = _fetch_page_with_session(sess, page_num=1)
+    _acquire_session(sess)
+    try:
+        QUERY_SESSIONS.put(session_id, sess)
+        await asyncio.to_thread(_save_session_state, sess)
+        page_data = await _load_session_page(sess, page_num=1)
+        _prefetch_next_page(sess, page_data)
+    finally:
+        _leave_session(sess)
     return {"success": True, "session_id": session_id, **page_data}
 
 
 @app.post("/api/query_page")
-def query_page(req: QueryPageRequest) -> dict[str, Any]:
-    sess = _get_query_session(req.session_id)
-    page_data = _fetch_page_with_session(sess, page_num=max(1, req.page_num))
+async def query_page(req: QueryPageRequest) -> dict[str, Any]:
+    sess = await _get_query_session(req.session_id)
+    try:
+        page_data = await _load_session_page(sess, page_num=max(1, req.page_num))
+        _prefetch_next_page(sess, page_data)
+    finally:
+        _leave_session(sess)
     return {"success": True, "session_id": req.session_id, **page_data}
 
 
-@app.post("/api/batch_query")
-def batch_query(req: BatchQueryRequest) -> dict[str, Any]:
+def _validate_batch_request(req: BatchQueryRequest, max_keywords: int = BATCH_MAX_KEYWORDS) -> list[str]:
     keywords = [x.strip() for x in req.keywords if x and x.strip()]
     if not keywords:
         raise HTTPException(status_code=400, detail="keywords 不能为空")
-    if len(keywords) > 100:
-        raise HTTPException(status_code=400, detail="单次最多 100 个查询词")
-    if req.transport not in ("curl", "requests"):
-        raise HTTPException(status_code=400, detail="transport 仅支持 curl/requests")
+    if len(keywords) > max_keywords:
+        raise HTTPException(status_code=400, detail=f"单次最多 {max_keywords} 个查询词")
+    if req.transport not in WEB_TRANSPORTS:
+        raise HTTPException(status_code=400, detail=f"transport 仅支持 {'/'.join(WEB_TRANSPORTS)}")
     if req.page_size <= 0 or req.page_size > 200:
         raise HTTPException(status_code=400, detail="page_size 需在 1~200 之间")
     if req.max_pages <= 0 or req.max_pages > 5000:
         raise HTTPException(status_code=400, detail="max_pages 需在 1~5000 之间")
+    return keywords
 
-    results: list[dict[str, Any]] = []
-    client = MiitIcpAutoClient(transport=req.transport)
+
+async def _checkout_client(transport: str, use_pool: bool) -> AsyncMiitIcpAutoClient:
+    if use_pool:
+        return await CLIENT_POOL.acquire(transport)
+    client = AsyncMiitIcpAutoClient(transport=transport)
     try:
-        client.auth()
+        await client.auth()
+    except Exception:
+        await client.close()
+        raise
+    return client
+
+
+async def _checkin_client(client: AsyncMiitIcpAutoClient | None, use_pool: bool) -> None:
+    if client is None:
+        return
+    if use_pool:
+        await CLIENT_POOL.release(client)
+    else:
+        await client.close()
+
+
+async def _prepare_batch(
+    req: BatchQueryRequest,
+    max_keywords: int = BATCH_MAX_KEYWORDS,
+    use_pool: bool = True,
+) -> tuple[list[str], AsyncMiitIcpAutoClient | None]:
+    keywords = _validate_batch_request(req, max_keywords=max_keywords)
+    # 全部命中缓存时不创建客户端，也不向上游发任何请求；缓存结果在输出时逐条读取，不整批载入内存。
+    client: AsyncMiitIcpAutoClient | None = None
+    if not await asyncio.to_thread(_all_cached, req, keywords):
+        client = await _checkout_batch_client(req, use_pool)
+    return keywords, client
+
+
+async def _checkout_batch_client(req: BatchQueryRequest, use_pool: bool) -> AsyncMiitIcpAutoClient:
+    try:
+        return await _checkout_client(req.transport, use_pool)
+    except PoolExhaustedError:
+        raise HTTPException(status_code=503, detail=POOL_EXHAUSTED_DETAIL)
     except Exception as exc:
         msg = str(exc)
         if "403" in msg or "Forbidden" in msg:
@@ -1015,76 +1361,399 @@ def batch_query(req: BatchQueryRequest) -> dict[str, Any]:
             )
         raise HTTPException(status_code=500, detail=f"鉴权失败: {msg}")
 
-    for idx, keyword in enumerate(keywords):
-        try:
-            row = _query_with_client(
-                client=client,
-                keyword=keyword,
-                service_type=req.service_type,
-                retries=req.retries,
-                page_size=req.page_size,
-                max_pages=req.max_pages,
-            )
-        except Exception as exc:
-            err = str(exc)
-            row = {
-                "query": keyword,
-                "query_type": "域名" if _is_domain(keyword) else "主体",
-                "ok": False,
-                "count": 0,
-                "record_columns": [],
-                "records": [],
-                "error": err,
-            }
-            if "403" in err or "Forbidden" in err:
-                row["error"] = "查询被风控拦截(HTTP 403)，建议暂停后重试。"
-                results.append(row)
-                break
-        results.append(row)
 
-        if idx != len(keywords) - 1 and req.delay_sec > 0:
-            time.sleep(min(req.delay_sec, 5.0))
+async def _iter_batch_rows(
+    req: BatchQueryRequest,
+    keywords: list[str],
+    client: AsyncMiitIcpAutoClient | None,
+    use_pool: bool = True,
+) -> AsyncIterator[dict[str, Any]]:
+    # 预判时命中、输出前已过期的关键词需要查上游，此时才借客户端，用完由这里归还。
+    own_client: AsyncMiitIcpAutoClient | None = None
+    depth = _batch_depth(req)
+    try:
+        for idx, keyword in enumerate(keywords):
+            if not req.refresh:
+                cached_row = await asyncio.to_thread(_cached_result_row, keyword, req.service_type, req.max_age, depth)
+                if cached_row is not None:
+                    yield cached_row
+                    continue
+            try:
+                if client is None:
+                    client = own_client = await _checkout_client(req.transport, use_pool)
+                row = await _query_with_client(
+                    client=client,
+                    keyword=keyword,
+                    service_type=req.service_type,
+                    retries=req.retries,
+                    page_size=req.page_size,
+                    max_pages=req.max_pages,
+                )
+            except Exception as exc:
+                err = str(exc)
+                row = {
+                    "query": keyword,
+                    "query_type": query_type_of(keyword),
+                    "ok": False,
+                    "count": 0,
+                    "record_columns": [],
+                    "records": [],
+                    "error": err,
+                }
+                if "403" in err or "Forbidden" in err:
+                    row["error"] = BATCH_BLOCKED_ERROR
+                    yield row
+                    return
+            yield row
+
+            if idx != len(keywords) - 1 and req.delay_sec > 0:
+                await asyncio.sleep(min(req.delay_sec, 5.0))
+    finally:
+        await _checkin_client(own_client, use_pool)
+
 
+@app.post("/api/batch_query")
+async def batch_query(req: BatchQueryRequest) -> dict[str, Any]:
+    keywords, client = await _prepare_batch(req)
+    try:
+        results = [row async for row in _iter_batch_rows(req, keywords, client)]
+    finally:
+        await _checkin_client(client, use_pool=True)
     return {"success": True, "results": results}
 
 
+@app.post("/api/batch_query_stream")
+async def batch_query_stream(req: BatchQueryRequest) -> StreamingResponse:
+    # 参数校验与鉴权在开始输出前完成，错误仍以普通 HTTP 状态码返回；之后每查完一个关键词输出一行 NDJSON。
+    keywords, client = await _prepare_batch(req)
+
+    async def ndjson_lines() -> AsyncIterator[bytes]:
+        try:
+            async for row in _iter_batch_rows(req, keywords, client):
+                yield (json.dumps(row, ensure_ascii=False) + "\n").encode("utf-8")
+        finally:
+            await _checkin_client(client, use_pool=True)
+
+    return StreamingResponse(
+        ndjson_lines(),
+        media_type="application/x-ndjson; charset=utf-8",
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+    )
+
+
+def _run_job_rows(
+    params: dict[str, Any],
+    pending: list[tuple[int, str]],
+) -> Iterator[tuple[int, dict[str, Any]]]:
+    # 任务在独立线程里执行，用该线程自己的事件循环逐条驱动异步查询；
+    # 连接池绑定主事件循环，这里单独建客户端。
+    if not pending:
+        return
+    req = BatchQueryRequest(**params, keywords=[kw for _, kw in pending])
+    loop = asyncio.new_event_loop()
+    client: AsyncMiitIcpAutoClient | None = None
+    try:
+        keywords, client = loop.run_until_complete(
+            _prepare_batch(req, max_keywords=JOB_MAX_KEYWORDS, use_pool=False)
+        )
+        rows = _iter_batch_rows(req, keywords, client, use_pool=False)
+        try:
+            for idx, _ in pending:
+                try:
+                    row = loop.run_until_complete(rows.__anext__())
+                except StopAsyncIteration:
+                    break
+                # 被风控拦截的关键词不记为已完成，任务暂停，resume 后从该关键词续跑。
+                if row.get("error") == BATCH_BLOCKED_ERROR:
+                    raise JobPaused(BATCH_BLOCKED_ERROR)
+                yield idx, row
+        finally:
+            loop.run_until_complete(rows.aclose())
+    finally:
+        loop.run_until_complete(_checkin_client(client, use_pool=False))
+        loop.close()
+
+
+JOB_MANAGER = JobManager(
+    JobStore(os.environ.get("ICP_JOB_DB_FILE", DEFAULT_JOB_DB_FILE)),
+    _run_job_rows,
+    workers=int(os.environ.get("ICP_JOB_WORKERS", DEFAULT_JOB_WORKERS)),
+    max_pending=int(os.environ.get("ICP_JOB_MAX_PENDING", DEFAULT_JOB_MAX_PENDING)),
+    stale_after=int(os.environ.get("ICP_JOB_STALE_AFTER", DEFAULT_JOB_STALE_AFTER)),
+)
+
+
+@app.on_event("startup")
+def _recover_jobs() -> None:
+    JOB_MANAGER.recover()
+
+
+@app.on_event("startup")
+async def _start_session_reaper() -> None:
+    async def reap_forever() -> None:
+        while True:
+            await asyncio.sleep(QUERY_SESSION_REAP_INTERVAL)
+            QUERY_SESSIONS.reap()
+            await CLIENT_POOL.reap()
+
+    app.state.session_reaper = asyncio.ensure_future(reap_forever())
+
+
+@app.on_event("shutdown")
+def _stop_jobs() -> None:
+    JOB_MANAGER.shutdown()
+    if OFFSET_POOL is not None:
+        OFFSET_POOL.shutdown()
+
+
+@app.on_event("shutdown")
+async def _stop_session_reaper() -> None:
+    reaper = getattr(app.state, "session_reaper", None)
+    if reaper is not None:
+        reaper.cancel()
+    await CLIENT_POOL.close()
+
+
+def _get_job(job_id: str) -> dict[str, Any]:
+    job = JOB_MANAGER.store.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    return job
+
+
+@app.post("/api/jobs")
+def submit_job(req: BatchQueryRequest) -> dict[str, Any]:
+    keywords = _validate_batch_request(req, max_keywords=JOB_MAX_KEYWORDS)
+    params = req.model_dump(exclude={"keywords"})
+    try:
+        job_id = JOB_MANAGER.submit(params, keywords)
+    except JobQueueFull as exc:
+        raise HTTPException(status_code=429, detail=str(exc))
+    return {"success": True, **_get_job(job_id)}
+
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str) -> dict[str, Any]:
+    return {"success": True, **_get_job(job_id)}
+
+
+@app.get("/api/jobs/{job_id}/results")
+def get_job_results(job_id: str, offset: int = 0, limit: int = 100) -> dict[str, Any]:
+    job = _get_job(job_id)
+    limit = max(1, min(limit, 1000))
+    results = list(JOB_MANAGER.store.iter_results(job_id, offset=max(0, offset), limit=limit))
+    return {"success": True, **job, "offset": max(0, offset), "results": results}
+
+
+@app.post("/api/jobs/{job_id}/cancel")
+def cancel_job(job_id: str) -> dict[str, Any]:
+    _get_job(job_id)
+    cancelled = JOB_MANAGER.cancel(job_id)
+    return {"success": True, "cancelled": cancelled, **_get_job(job_id)}
+
+
+@app.post("/api/jobs/{job_id}/resume")
+def resume_job(job_id: str) -> dict[str, Any]:
+    _get_job(job_id)
+    try:
+        resumed = JOB_MANAGER.resume(job_id)
+    except JobQueueFull as exc:
+        raise HTTPException(status_code=429, detail=str(exc))
+    return {"success": True, "resumed": resumed, **_get_job(job_id)}
+
+
+@app.get("/api/index/search")
+async def search_index(
+    q: str,
+    mode: str = "auto",
+    service_type: int | None = None,
+    limit: int = DEFAULT_SEARCH_LIMIT,
+    fallback: bool = False,
+    transport: str = "curl",
+    retries: int = 8,
+) -> dict[str, Any]:
+    # 先查本地索引(精确/前缀/子串)；未命中且 fallback=true 时实时查询工信部接口，结果同时写入索引。
+    if RECORD_INDEX is None:
+        raise HTTPException(status_code=503, detail="本地索引未启用(ICP_INDEX_FILE 为空)")
+    term = (q or "").strip()
+    if not term:
+        raise HTTPException(status_code=400, detail="q 不能为空")
+    if mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail="mode 仅支持 " + "/".join(SEARCH_MODES))
+    limit = max(1, min(limit, 1000))
+    used_mode, records = await asyncio.to_thread(
+        RECORD_INDEX.search, term, mode=mode, service_type=service_type, limit=limit
+    )
+    if records or not fallback:
+        return {"success": True, "source": "index", "mode": used_mode, "count": len(records), "records": records}
+
+    if transport not in WEB_TRANSPORTS:
+        raise HTTPException(status_code=400, detail=f"transport 仅支持 {'/'.join(WEB_TRANSPORTS)}")
+    try:
+        client = await _checkout_client(transport, use_pool=True)
+    except PoolExhaustedError:
+        raise HTTPException(status_code=503, detail=POOL_EXHAUSTED_DETAIL)
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"鉴权失败: {exc}")
+    try:
+        row = await _query_with_client(client, term, service_type or 1, retries, page_size=10, max_pages=2000)
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"查询失败: {exc}")
+    finally:
+        await _checkin_client(client, use_pool=True)
+    records = row["records"][:limit]
+    return {"success": True, "source": "upstream", "mode": used_mode, "count": len(records), "records": records}
+
+
+REGISTRY.gauge("icp_query_sessions", "Live paging sessions held by this worker.", lambda: len(QUERY_SESSIONS))
+REGISTRY.gauge(
+    "icp_query_sessions_approx_bytes",
+    "Estimated memory held by paging sessions (per-session base plus cached page JSON).",
+    lambda: QUERY_SESSIONS.stats()["approx_bytes"],
+)
+REGISTRY.gauge("icp_client_pool_idle", "Idle warm clients in the pool.", lambda: CLIENT_POOL.stats()["idle"])
+REGISTRY.gauge("icp_client_pool_in_use", "Clients checked out of the pool.", lambda: CLIENT_POOL.stats()["in_use"])
+REGISTRY.gauge(
+    "icp_client_pool_waiting", "Requests waiting for a free pooled client.", lambda: CLIENT_POOL.stats()["waiting"]
+)
+
+
+@app.middleware("http")
+async def _observe_request(request: Request, call_next: Any) -> Any:
+    # 按路由模板(而非实际路径)统计，避免 job_id/session_id 造成标签爆炸；流式响应只计到响应头发出。
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        handler = getattr(request.scope.get("route"), "path", "unmatched")
+        HTTP_SECONDS.observe(time.perf_counter() - started, handler)
+        HTTP_REQUESTS.inc(handler, str(status))
+
+
+@app.get("/metrics")
+def metrics() -> PlainTextResponse:
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/api/stats")
+def stats() -> dict[str, Any]:
+    return {
+        "success": True,
+        "detail_shapes": DETAIL_SHAPES.stats(),
+        "detail_cache": DETAIL_CACHE.stats(),
+        "query_sessions": QUERY_SESSIONS.stats(),
+        "client_pool": CLIENT_POOL.stats(),
+        "index_records": len(RECORD_INDEX) if RECORD_INDEX is not None else None,
+        "offset_pool": OFFSET_POOL.stats() if OFFSET_POOL is not None else None,
+    }
+
+
 @app.post("/api/export_csv")
 def export_csv(req: ExportRequest) -> StreamingResponse:
-    output = io.StringIO()
-    writer = csv.writer(output)
+    return StreamingResponse(
+        iter_csv_chunks(req.results),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": 'attachment; filename="icp_batch_results.csv"'},
+    )
 
-    dynamic_cols: list[str] = []
+
+def _check_export_format(fmt: str) -> str:
+    fmt = (fmt or "").lower()
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format 仅支持 " + "/".join(EXPORT_FORMATS))
+    return fmt
+
+
+def _export_response(
+    fmt: str,
+    rows: Iterable[dict[str, Any]],
+    columns: list[str] | None,
+    filename: str,
+) -> StreamingResponse:
+    media_type, ext = EXPORT_FORMATS[fmt]
+    if fmt == "csv":
+        body: Iterable[bytes] = iter_csv_chunks(rows, columns)
+    elif fmt == "jsonl":
+        body = iter_jsonl_chunks(rows)
+    else:
+        builder, package = BINARY_EXPORTS[fmt]
+        try:
+            body = [builder(rows, columns)]
+        except ImportError:
+            raise HTTPException(status_code=501, detail=f"导出 {fmt} 需要安装 {package}: pip install {package}")
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{ext}"'},
+    )
+
+
+def _iter_job_rows(job_id: str, limit: int | None = None) -> Iterator[dict[str, Any]]:
+    # 分批从任务库读取，导出大任务时内存只保留一批结果。
+    offset = 0
+    while limit is None or offset < limit:
+        size = JOB_EXPORT_BATCH if limit is None else min(JOB_EXPORT_BATCH, limit - offset)
+        batch = list(JOB_MANAGER.store.iter_results(job_id, offset=offset, limit=size))
+        yield from batch
+        if len(batch) < size:
+            return
+        offset += len(batch)
+
+
+@app.get("/api/jobs/{job_id}/export")
+def export_job(job_id: str, fmt: str = Query("csv", alias="format")) -> StreamingResponse:
+    # 直接导出服务端保存的任务结果，浏览器无需回传整批数据。
+    fmt = _check_export_format(fmt)
+    _get_job(job_id)
+    if fmt == "jsonl":
+        return _export_response(fmt, _iter_job_rows(job_id), None, f"icp_job_{job_id}")
+    # csv/xlsx 表头需要列并集：先扫一遍统计列和行数，第二遍只导出这些行，任务仍在运行时两遍结果一致。
+    count = 0
+    columns: list[str] = []
     seen: set[str] = set()
-    for row in req.results:
+    for row in _iter_job_rows(job_id):
+        count += 1
         for c in row.get("record_columns") or []:
             if c not in seen:
                 seen.add(c)
-                dynamic_cols.append(c)
-
-    header = ["query", "query_type", "ok", "count"] + dynamic_cols + ["error"]
-    writer.writerow(header)
-
-    for row in req.results:
-        query = row.get("query", "")
-        query_type = row.get("query_type", "")
-        ok = row.get("ok", False)
-        count = row.get("count", 0)
-        error = row.get("error", "")
-        records = row.get("records") or []
-
-        if ok and records:
-            for rec in records:
-                values = [rec.get(c, "") if isinstance(rec, dict) else "" for c in dynamic_cols]
-                writer.writerow([query, query_type, ok, count, *values, ""])
-        else:
-            writer.writerow([query, query_type, ok, count, *([""] * len(dynamic_cols)), error])
-
-    output.seek(0)
-    return StreamingResponse(
-        iter([output.getvalue().encode("utf-8-sig")]),
-        media_type="text/csv; charset=utf-8",
-        headers={"Content-Disposition": 'attachment; filename="icp_batch_results.csv"'},
-    )
+                columns.append(c)
+    return _export_response(fmt, _iter_job_rows(job_id, limit=count), columns, f"icp_job_{job_id}")
+
+
+async def _collect_session_result(sess: dict[str, Any]) -> dict[str, Any]:
+    # 服务端按会话逐页拉取(已缓存的页直接复用)，合并成一行查询结果。
+    first = await _load_session_page(sess, page_num=1)
+    records = list(first.get("records") or [])
+    pages = min(int(first.get("pages") or 1), SESSION_EXPORT_MAX_PAGES)
+    for page_num in range(2, pages + 1):
+        page = await _load_session_page(sess, page_num=page_num)
+        records.extend(page.get("records") or [])
+
+    keyword = sess["keyword"]
+    return {
+        "query": keyword,
+        "query_type": query_type_of(keyword),
+        "ok": True,
+        "count": len(records),
+        "record_columns": record_columns(records),
+        "records": records,
+    }
+
+
+@app.get("/api/query_sessions/{session_id}/export")
+async def export_query_session(session_id: str, fmt: str = Query("csv", alias="format")) -> StreamingResponse:
+    fmt = _check_export_format(fmt)
+    sess = await _get_query_session(session_id)
+    try:
+        row = await _collect_session_result(sess)
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"查询失败: {exc}")
+    finally:
+        _leave_session(sess)
+    return await asyncio.to_thread(_export_response, fmt, [row], None, f"icp_{session_id}")
 
 
 if __name__ == "__main__":